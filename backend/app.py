@@ -1,7 +1,28 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response, Header
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from starlette.middleware.gzip import GZipMiddleware
 from google.cloud import storage
-from datetime import timedelta
-import psycopg2
+from datetime import date, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import psycopg.errors
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+import asyncio
+import threading
+import time
+import hashlib
+import hmac
+import json
+import base64
+import orjson
+import csv
+import io
+import logging
+import weakref
 from google.oauth2 import service_account
 import os
 from dotenv import load_dotenv
@@ -10,7 +31,65 @@ from chromadb import PersistentClient
 
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    await _pool.open()
+    yield
+    await _pool.close()
+    ejecutor_bloqueante.shutdown(wait=False)
+
+app = FastAPI(lifespan=ciclo_de_vida, default_response_class=ORJSONResponse)
+
+# Metricas en formato Prometheus, expuestas en GET /metrics: peticiones y
+# latencia por endpoint, duracion de cada consulta SQL, espera por una conexion
+# del pool y tiempo de las tareas bloqueantes del ejecutor. Con un solo worker
+# de uvicorn; con varios cada proceso tendria sus propios contadores.
+PETICIONES = Counter("backend_peticiones_total", "Peticiones por endpoint", ["metodo", "ruta", "estado"])
+DURACION_PETICION = Histogram("backend_peticion_segundos", "Latencia por endpoint", ["metodo", "ruta"])
+DURACION_SQL = Histogram("backend_sql_segundos", "Duracion de cada consulta SQL", ["consulta"])
+ERRORES_SQL = Counter("backend_sql_errores_total", "Consultas SQL fallidas", ["consulta"])
+ESPERA_POOL = Histogram("backend_pool_espera_segundos", "Espera por una conexion del pool")
+DURACION_BLOQUEANTE = Histogram("backend_bloqueante_segundos", "Tareas del ejecutor, con su espera en cola", ["tarea"])
+
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    inicio = time.perf_counter()
+    estado = 500
+    try:
+        respuesta = await call_next(request)
+        estado = respuesta.status_code
+        return respuesta
+    finally:
+        # la ruta con parametros ("/descargar/{ndetalle}") y no la url, para no
+        # crear una serie por ndetalle
+        ruta = getattr(request.scope.get("route"), "path", "sin_ruta")
+        DURACION_PETICION.labels(request.method, ruta).observe(time.perf_counter() - inicio)
+        PETICIONES.labels(request.method, ruta, str(estado)).inc()
+
+@contextmanager
+def medir_sql(consulta):
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORES_SQL.labels(consulta).inc()
+        raise
+    finally:
+        DURACION_SQL.labels(consulta).observe(time.perf_counter() - inicio)
+
+@app.get("/metrics")
+async def metricas():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# Respuestas comprimidas desde COMPRESION-MIN-BYTES: brotli si el cliente lo
+# acepta y esta instalado brotli-asgi, si no gzip.
+COMPRESION_MIN_BYTES = int(os.getenv("COMPRESION-MIN-BYTES", "1024"))
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=COMPRESION_MIN_BYTES, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESION_MIN_BYTES, compresslevel=5)
+logger = logging.getLogger(__name__)
 
 LISTA_ORGANO_PERMITIDOS = [
     "SEGUNDA SALA DE DERECHO CONSTITUCIONAL Y SOCIAL TRANSITORIA",
@@ -22,153 +101,391 @@ LISTA_ORGANO_PERMITIDOS = [
     "TERCERA SALA DE DERECHO CONSTITUCIONAL Y SOCIAL TRANSITORIA"
 ]
 
-# Configuración de Google Cloud Storage
-credentials = service_account.Credentials.from_service_account_file('credenciales.json')
-storage_client = storage.Client(credentials=credentials)
-bucket = storage_client.bucket("automatizacion-casillero")
-
-def get_db_connection():
-    return psycopg2.connect(
+# Configuración de Google Cloud Storage; con BUCKET-LOCAL se usa una carpeta
+# local en su lugar (benchmarks/)
+if os.getenv("BUCKET-LOCAL"):
+    from bucket_local import BucketLocal
+    bucket = BucketLocal(os.getenv("BUCKET-LOCAL"))
+else:
+    credentials = service_account.Credentials.from_service_account_file('credenciales.json')
+    storage_client = storage.Client(credentials=credentials)
+    bucket = storage_client.bucket("automatizacion-casillero")
+
+# Pool asincrono de conexiones (psycopg 3) compartido por todos los endpoints.
+# Los handlers esperan una conexion libre sin ocupar un hilo; el pool pone en
+# cola las esperas y descarta solo las conexiones rotas. Las conexiones van en
+# autocommit porque los endpoints solo leen.
+DB_POOL_MIN = int(os.getenv("DB-POOL-MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB-POOL-MAX", "10"))
+DB_POOL_TIMEOUT_SEGUNDOS = float(os.getenv("DB-POOL-TIMEOUT-SEGUNDOS", "30"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB-STATEMENT-TIMEOUT-MS", "10000"))
+DB_POOL_PING_SEGUNDOS = float(os.getenv("DB-POOL-PING-SEGUNDOS", "30"))
+
+# ultimo uso de cada conexion; con claves debiles la entrada desaparece cuando
+# el pool descarta la conexion y nunca se confunde con otra que reuse su id
+_ultimo_uso = weakref.WeakKeyDictionary()
+
+async def revisar_conexion(conn):
+    # solo se hace ping a las conexiones que llevan un rato sin usarse; si
+    # falla, el pool la descarta y entrega otra
+    if time.monotonic() - _ultimo_uso.get(conn, 0) < DB_POOL_PING_SEGUNDOS:
+        return
+    await conn.execute("SELECT 1")
+
+_pool = AsyncConnectionPool(
+    make_conninfo(
         host=os.getenv("DB-HOST"),
         port=os.getenv("DB-PORT"),
         dbname=os.getenv("DB-NAME"),
         user=os.getenv("USERNAME-DB"),
         password=os.getenv("PASSWORD-DB"),
-        options='-c statement_timeout=10000'  # 10 segundos
+        options=f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'
+    ),
+    min_size=DB_POOL_MIN,
+    max_size=DB_POOL_MAX,
+    timeout=DB_POOL_TIMEOUT_SEGUNDOS,
+    kwargs={"autocommit": True},
+    check=revisar_conexion,
+    open=False
+)
+
+@asynccontextmanager
+async def conexion_db():
+    inicio = time.perf_counter()
+    async with _pool.connection() as conn:
+        ESPERA_POOL.observe(time.perf_counter() - inicio)
+        try:
+            yield conn
+        finally:
+            _ultimo_uso[conn] = time.monotonic()
+
+# Chroma, la firma de URLs de GCS y el modelo de embeddings son bloqueantes: se
+# ejecutan en un pool de hilos propio para no frenar el event loop ni competir
+# con el threadpool de FastAPI.
+EJECUTOR_HILOS = int(os.getenv("EJECUTOR-HILOS", "16"))
+ejecutor_bloqueante = ThreadPoolExecutor(max_workers=EJECUTOR_HILOS, thread_name_prefix="bloqueante")
+
+async def en_ejecutor(funcion, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    inicio = time.perf_counter()
+    try:
+        return await loop.run_in_executor(ejecutor_bloqueante, partial(funcion, *args, **kwargs))
+    finally:
+        tarea = getattr(funcion, "__qualname__", "tarea")
+        DURACION_BLOQUEANTE.labels(tarea).observe(time.perf_counter() - inicio)
+
+# Cliente de Chroma unico para todo el proceso y un indice en memoria
+# materia -> ndetalles ordenados, para no recorrer la coleccion en cada request.
+CHROMA_PATH = os.getenv("CHROMA-PATH", "/app/chroma_db")
+CHROMA_COLECCION = "materias_final_prueba"
+CHROMA_REFRESCO_SEGUNDOS = float(os.getenv("CHROMA-REFRESCO-SEGUNDOS", "600"))
+CHROMA_REVISION_SEGUNDOS = float(os.getenv("CHROMA-REVISION-SEGUNDOS", "10"))
+
+chroma_client = PersistentClient(path=CHROMA_PATH)
+
+class IndiceMaterias:
+
+    def __init__(self, client, nombre_coleccion, refresco_segundos, revision_segundos, tamano_pagina=5000):
+        self.client = client
+        self.nombre_coleccion = nombre_coleccion
+        self.refresco_segundos = refresco_segundos
+        self.revision_segundos = revision_segundos
+        self.tamano_pagina = tamano_pagina
+        self._lock = threading.Lock()
+        self._materias = []
+        self._por_materia = {}
+        self._total = None
+        self._construido = 0.0
+        self._revisado = 0.0
+
+    def _construir(self, coleccion, total):
+        materias = set()
+        por_materia = {}
+        for offset in range(0, total, self.tamano_pagina):
+            resultados = coleccion.get(include=["metadatas"], limit=self.tamano_pagina, offset=offset)
+            for id_, meta in zip(resultados["ids"], resultados["metadatas"]):
+                if not meta or "materia" not in meta:
+                    continue
+                materias.add(meta["materia"])
+                if id_.startswith("id_") and id_.endswith("_materia"):
+                    por_materia.setdefault(meta["materia"], []).append(id_[3:-8])  # elimina 'id_' y '_materia'
+        self._materias = sorted(materias)
+        self._por_materia = {materia: tuple(sorted(nds)) for materia, nds in por_materia.items()}
+        self._total = total
+        self._construido = time.monotonic()
+
+    def _actualizar(self):
+        # se reconstruye si la coleccion cambio de tamano (revisado cada
+        # revision_segundos) o si paso refresco_segundos desde la ultima vez
+        ahora = time.monotonic()
+        if self._total is not None and ahora - self._revisado < self.revision_segundos:
+            return
+        with self._lock:
+            if self._total is not None and ahora - self._revisado < self.revision_segundos:
+                return
+            coleccion = self.client.get_collection(self.nombre_coleccion)
+            total = coleccion.count()
+            if total != self._total or ahora - self._construido >= self.refresco_segundos:
+                self._construir(coleccion, total)
+            self._revisado = ahora
+
+    def materias(self):
+        self._actualizar()
+        return self._materias
+
+    def ndetalles(self, materia):
+        self._actualizar()
+        return self._por_materia.get(materia, ())
+
+indice_materias = IndiceMaterias(chroma_client, CHROMA_COLECCION, CHROMA_REFRESCO_SEGUNDOS, CHROMA_REVISION_SEGUNDOS)
+
+# Las URLs firmadas duran URL_FIRMADA_MINUTOS; se reutilizan hasta
+# URL_FIRMADA_MARGEN_MINUTOS antes de vencer para que el cliente siempre
+# reciba una URL con tiempo de sobra.
+URL_FIRMADA_MINUTOS = 180
+URL_FIRMADA_MARGEN_MINUTOS = int(os.getenv("URL-FIRMADA-MARGEN-MINUTOS", "15"))
+URL_FIRMADA_CACHE_MAX = int(os.getenv("URL-FIRMADA-CACHE-MAX", "50000"))
+MAX_NDETALLES_DESCARGA = 500
+
+_cache_urls = {}  # blob -> (url firmada, momento en que deja de reutilizarse)
+
+def url_firmada(blob_name):
+    ahora = time.monotonic()
+    en_cache = _cache_urls.get(blob_name)
+    if en_cache and en_cache[1] > ahora:
+        return en_cache[0]
+
+    blob = bucket.blob(blob_name)
+    signed_url = blob.generate_signed_url(
+        version="v4",
+        expiration=timedelta(minutes=URL_FIRMADA_MINUTOS),
+        method="GET"
     )
 
+    if len(_cache_urls) >= URL_FIRMADA_CACHE_MAX:
+        for clave, (_, vence) in list(_cache_urls.items()):
+            if vence <= ahora:
+                _cache_urls.pop(clave, None)
+        if len(_cache_urls) >= URL_FIRMADA_CACHE_MAX:
+            _cache_urls.clear()
+    _cache_urls[blob_name] = (signed_url, ahora + (URL_FIRMADA_MINUTOS - URL_FIRMADA_MARGEN_MINUTOS) * 60)
+    return signed_url
+
+def urls_firmadas(blob_names):
+    return [url_firmada(blob_name) for blob_name in blob_names]
+
 @app.get("/descargar/{ndetalle}")
-def generar_url(ndetalle: str):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT url FROM sentencias_y_autos WHERE ndetalle = %s", (ndetalle,))
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
+async def generar_url(ndetalle: str):
+    async with conexion_db() as conn:
+        with medir_sql("descargar"):
+            cur = await conn.execute("SELECT url FROM sentencias_y_autos WHERE ndetalle = %s", (ndetalle,))
+            result = await cur.fetchone()
 
     if not result or result[0] is None:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
 
-    blob_name = result[0]
-    blob = bucket.blob(blob_name)
+    return {"url": await en_ejecutor(url_firmada, result[0])}
 
-    signed_url = blob.generate_signed_url(
-        version="v4",
-        expiration=timedelta(minutes=180),
-        method="GET"
-    )
+@app.get("/descargar")
+async def generar_urls(ndetalles: List[str] = Query(...)):
+    # URLs de una pagina completa de resultados con una sola consulta;
+    # los ndetalles sin pdf vuelven con None
+    if len(ndetalles) > MAX_NDETALLES_DESCARGA:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_NDETALLES_DESCARGA} ndetalles por consulta.")
 
-    return {"url": signed_url}
+    async with conexion_db() as conn:
+        with medir_sql("descargar_lote"):
+            cur = await conn.execute(
+                "SELECT ndetalle, url FROM sentencias_y_autos WHERE ndetalle = ANY(%s) AND url IS NOT NULL",
+                (ndetalles,)
+            )
+            filas = await cur.fetchall()
+
+    # toda la pagina se firma en una sola tarea del ejecutor
+    urls = {ndetalle: None for ndetalle in ndetalles}
+    firmadas = await en_ejecutor(urls_firmadas, [blob_name for _, blob_name in filas])
+    for (ndetalle, _), signed_url in zip(filas, firmadas):
+        urls[ndetalle] = signed_url
+
+    return ORJSONResponse({"urls": urls})
+
+async def calcular_filtros():
+    async with conexion_db() as conn:
+
+        #cur.execute("SELECT DISTINCT organo_detalle FROM sentencias_y_autos WHERE organo_detalle IS NOT NULL;")
+
+        with medir_sql("filtros_jueces"):
+            cur = await conn.execute("""
+                SELECT DISTINCT j.nombre_juez
+                FROM jueces j
+                JOIN sentencias_jueces sj ON sj.codigo = j.codigo
+                JOIN sentencias_y_autos s ON s.ndetalle = sj.ndetalle
+                WHERE j.nombre_juez IS NOT NULL;
+            """)
+            lista_juez = [r[0] for r in await cur.fetchall()]
+
+    materias = await en_ejecutor(indice_materias.materias)
 
-@app.get("/filters")
-def obtener_filtros():
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    #cur.execute("SELECT DISTINCT organo_detalle FROM sentencias_y_autos WHERE organo_detalle IS NOT NULL;")
-
-    cur.execute("""
-        SELECT DISTINCT j.nombre_juez
-        FROM jueces j
-        JOIN sentencias_jueces sj ON sj.codigo = j.codigo
-        JOIN sentencias_y_autos s ON s.ndetalle = sj.ndetalle
-        WHERE j.nombre_juez IS NOT NULL;
-    """)
-    lista_juez = [r[0] for r in cur.fetchall()]
-
-    client = PersistentClient(path="/app/chroma_db")  # ajusta el path si fuera necesario
-    collection = client.get_collection("materias_final_prueba")
-
-    # Obtener metadatos
-    resultados = collection.get(include=["metadatas"])
-    materias = set()
-    for meta in resultados["metadatas"]:
-        if meta and "materia" in meta:
-            materias.add(meta["materia"])
-
-    cur.close()
-    conn.close()
     return {
         "organo_detalle": sorted(LISTA_ORGANO_PERMITIDOS),
         "nombre_juez": sorted(lista_juez),
-        "materias": sorted(materias)
+        "materias": materias
     }
 
-@app.get("/statistics")
-def estadisticas(
-    fecha_desde: Optional[str] = Query(None),
-    fecha_hasta: Optional[str] = Query(None),
-    lista_jueces: Optional[List[str]] = Query(None)
-):
-    conn = get_db_connection()
-    cur = conn.cursor()
+# Cache de /filters: el cuerpo ya serializado, su ETag y la fecha en que cambio
+# por ultima vez. Se recalcula al vencer el TTL o cuando la carga de datos
+# avisa por POST /filters/invalidar.
+FILTROS_TTL_SEGUNDOS = float(os.getenv("FILTROS-TTL-SEGUNDOS", "300"))
+TOKEN_INVALIDACION = os.getenv("TOKEN-INVALIDACION")
+
+_cache_filtros = {"cuerpo": None, "etag": None, "modificado": 0.0, "expira": 0.0}
+_cache_filtros_lock = asyncio.Lock()
+
+async def filtros_en_cache():
+    if time.monotonic() < _cache_filtros["expira"]:
+        return _cache_filtros
+    async with _cache_filtros_lock:
+        if time.monotonic() < _cache_filtros["expira"]:
+            return _cache_filtros
+        cuerpo = orjson.dumps(await calcular_filtros())
+        etag = '"' + hashlib.sha1(cuerpo).hexdigest() + '"'
+        if etag != _cache_filtros["etag"]:
+            _cache_filtros.update(cuerpo=cuerpo, etag=etag, modificado=time.time())
+        _cache_filtros["expira"] = time.monotonic() + FILTROS_TTL_SEGUNDOS
+    return _cache_filtros
+
+def no_modificado(request, etag, modificado):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etags = [x.strip() for x in if_none_match.split(",")]
+        return "*" in etags or etag in etags or f"W/{etag}" in etags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(modificado) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
 
+@app.get("/filters")
+async def obtener_filtros(request: Request):
+    cache = await filtros_en_cache()
+    cuerpo, etag, modificado = cache["cuerpo"], cache["etag"], cache["modificado"]
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modificado, usegmt=True),
+        "Cache-Control": f"max-age={int(FILTROS_TTL_SEGUNDOS)}",
+    }
+    if no_modificado(request, etag, modificado):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
+
+@app.post("/filters/invalidar")
+async def invalidar_filtros(x_token: Optional[str] = Header(None)):
+    # sin TOKEN-INVALIDACION configurado el endpoint no existe: si no,
+    # cualquiera podria vaciar la cache y forzar calcular_filtros
+    if not TOKEN_INVALIDACION:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_token or "", TOKEN_INVALIDACION):
+        raise HTTPException(status_code=403, detail="Token invalido.")
+    _cache_filtros["expira"] = 0.0
+    return {"invalidado": True}
+
+def filtros_estadisticas(fecha_desde, fecha_hasta, lista_jueces, s="s", j="j"):
+    # s y j son los alias de donde salen las columnas de la sentencia y del juez
     filtros_where = []
     params: List = []
 
     if fecha_desde:
-        filtros_where.append("s.fecha_resolucion >= %s")
+        filtros_where.append(f"{s}.fecha_resolucion >= %s")
         params.append(fecha_desde)
     if fecha_hasta:
-        filtros_where.append("s.fecha_resolucion <= %s")
+        filtros_where.append(f"{s}.fecha_resolucion <= %s")
         params.append(fecha_hasta)
     if lista_jueces:
-        filtros_where.append("j.nombre_juez = ANY(%s)")
+        filtros_where.append(f"{j}.nombre_juez = ANY(%s)")
         params.append(lista_jueces)
 
-    from_clause = """
-        sentencias_y_autos s
-        LEFT JOIN sentencias_jueces sj ON sj.ndetalle = s.ndetalle
-        LEFT JOIN jueces j ON j.codigo = sj.codigo
-    """
-
     # 👉 Aquí se añade el filtro por las salas permitidas
-    filtros_where.append("s.organo_detalle = ANY(%s)")
+    filtros_where.append(f"{s}.organo_detalle = ANY(%s)")
     params.append(LISTA_ORGANO_PERMITIDOS)
-    
-    where_sql = ""
-    if filtros_where:
-        where_sql = "WHERE " + " AND ".join(filtros_where)
-
-    select_query = f"""
-        SELECT
-            j.nombre_juez,
-            COUNT(*) AS total,
-            COUNT(*) - COUNT(s.url) AS nulos
-        FROM 
-            {from_clause}
-            {where_sql}
-        GROUP BY
-            j.codigo, j.nombre_juez
-        ORDER BY
-            j.nombre_juez ASC;
-    """
-
-    cur.execute(select_query, tuple(params))
-    filas = cur.fetchall()
-    cur.close()
-    conn.close()
 
-    return [
-        {"juez": row[0], "total": row[1], "nulos": row[2]}
-        for row in filas
-    ]
+    return "WHERE " + " AND ".join(filtros_where), params
 
+CLAVES_ESTADISTICAS = ("juez", "total", "nulos")
 
-@app.get("/search")
-def buscar_sentencias(
-    organo_detalle: Optional[str] = Query(None),
-    nombre_juez: Optional[str] = Query(None),
+@app.get("/statistics")
+async def estadisticas(
     fecha_desde: Optional[str] = Query(None),
     fecha_hasta: Optional[str] = Query(None),
-    clasificacion_fundada: Optional[bool] = False,
-    materia: Optional[str] = Query(None),
-    limit: int = 100,
-    offset: int = 0
+    lista_jueces: Optional[List[str]] = Query(None)
 ):
-    conn = get_db_connection()
-    cur = conn.cursor()
+    # se suman los grupos (juez, organo, fecha) que precalcula la carga de datos
+    where_sql, params = filtros_estadisticas(fecha_desde, fecha_hasta, lista_jueces, s="e", j="e")
+    select_query = f"""
+        SELECT
+            e.nombre_juez,
+            SUM(e.total)::bigint AS total,
+            SUM(e.nulos)::bigint AS nulos
+        FROM estadisticas_jueces e
+        {where_sql}
+        GROUP BY
+            e.codigo, e.nombre_juez
+        ORDER BY
+            e.nombre_juez ASC;
+    """
 
+    async with conexion_db() as conn:
+        with medir_sql("estadisticas"):
+            try:
+                cur = await conn.execute(select_query, tuple(params))
+            except psycopg.errors.UndefinedTable:
+                # aun no se creo el resumen: se calcula sobre las tablas originales
+                where_sql, params = filtros_estadisticas(fecha_desde, fecha_hasta, lista_jueces)
+                cur = await conn.execute(f"""
+                    SELECT
+                        j.nombre_juez,
+                        COUNT(*) AS total,
+                        COUNT(*) - COUNT(s.url) AS nulos
+                    FROM 
+                        sentencias_y_autos s
+                        LEFT JOIN sentencias_jueces sj ON sj.ndetalle = s.ndetalle
+                        LEFT JOIN jueces j ON j.codigo = sj.codigo
+                        {where_sql}
+                    GROUP BY
+                        j.codigo, j.nombre_juez
+                    ORDER BY
+                        j.nombre_juez ASC;
+                """, tuple(params))
+            filas = await cur.fetchall()
+
+    # las respuestas grandes se devuelven ya como ORJSONResponse para saltarse
+    # el jsonable_encoder de FastAPI, que recorre cada valor en Python
+    return ORJSONResponse([dict(zip(CLAVES_ESTADISTICAS, row)) for row in filas])
+
+
+def crear_cursor(fecha_resolucion, ndetalle):
+    # cursor opaco con la ultima fila de la pagina: (fecha_resolucion, ndetalle)
+    fecha = None if fecha_resolucion is None else str(fecha_resolucion)
+    crudo = json.dumps([fecha, ndetalle]).encode("utf-8")
+    return base64.urlsafe_b64encode(crudo).decode("ascii")
+
+def leer_cursor(cursor):
+    # ademas de decodificar, se valida la forma: [fecha ISO o null, ndetalle]
+    try:
+        valor = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        fecha, ndetalle = valor
+        if not isinstance(ndetalle, str) or not (fecha is None or isinstance(fecha, str)):
+            raise ValueError("cursor con tipos inesperados")
+        if fecha is not None:
+            date.fromisoformat(fecha)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+    return fecha, ndetalle
+
+async def filtros_busqueda(organo_detalle, nombre_juez, fecha_desde, fecha_hasta, clasificacion_fundada, materia):
+    # condiciones sobre sentencias_y_autos s comunes a las busquedas; devuelve
+    # None si la materia no tiene ninguna sentencia
     filtros_where = []
     params: List = []
 
@@ -183,7 +500,13 @@ def buscar_sentencias(
         params.append(LISTA_ORGANO_PERMITIDOS)
 
     if nombre_juez:
-        filtros_where.append("j.nombre_juez = %s")
+        # semi-join: no multiplica filas, asi que no hace falta DISTINCT
+        filtros_where.append("""EXISTS (
+            SELECT 1
+            FROM sentencias_jueces sj
+            JOIN jueces j ON j.codigo = sj.codigo
+            WHERE sj.ndetalle = s.ndetalle AND j.nombre_juez = %s
+        )""")
         params.append(nombre_juez)
     if fecha_desde:
         filtros_where.append("s.fecha_resolucion >= %s")
@@ -194,107 +517,427 @@ def buscar_sentencias(
     if clasificacion_fundada:
         filtros_where.append("s.clasificacion IN (%s, %s)")
         params.extend(["fundado", "infundado"])
+    if materia:
+        ndetalles_chroma = await en_ejecutor(indice_materias.ndetalles, materia)
+        if not ndetalles_chroma:
+            return None
+        filtros_where.append("s.ndetalle = ANY(%s)")
+        params.append(list(ndetalles_chroma))
 
-    from_clause = "sentencias_y_autos s LEFT JOIN sentencias_jueces sj ON sj.ndetalle = s.ndetalle LEFT JOIN jueces j ON j.codigo = sj.codigo"
-
-    where_sql = ""
     filtros_where.append("s.url IS NOT NULL")
-    if filtros_where:
-        where_sql = "WHERE " + " AND ".join(filtros_where)
+    return filtros_where, params
 
-    count_query = f"""
-        SELECT COUNT(DISTINCT s.ndetalle)
-        FROM {from_clause}
-        {where_sql};
-    """
-    cur.execute(count_query, tuple(params))
-    total_count = cur.fetchone()[0]
+CLAVES_BUSQUEDA = ("ndetalle", "url", "clasificacion")
+CLAVES_BUSQUEDA_TEXTO = CLAVES_BUSQUEDA + ("rank", "fragmento")
 
+@app.get("/search")
+async def buscar_sentencias(
+    organo_detalle: Optional[str] = Query(None),
+    nombre_juez: Optional[str] = Query(None),
+    fecha_desde: Optional[str] = Query(None),
+    fecha_hasta: Optional[str] = Query(None),
+    clasificacion_fundada: Optional[bool] = False,
+    materia: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
+    q: Optional[str] = Query(None)
+):
+    if q and cursor:
+        raise HTTPException(status_code=400, detail="El cursor no está disponible en la búsqueda por texto.")
+
+    filtros = await filtros_busqueda(organo_detalle, nombre_juez, fecha_desde, fecha_hasta, clasificacion_fundada, materia)
+    if filtros is None:
+        return {"total_count": 0, "items": [], "next_cursor": None}
+    filtros_where, params = filtros
+
+    # busqueda por texto completo sobre textos_sentencias (indice GIN), ordenada
+    # por relevancia y con fragmentos resaltados solo para la pagina
+    columnas = "s.ndetalle, s.url, s.clasificacion, s.fecha_resolucion"
+    desde = "sentencias_y_autos s"
+    orden = ["fecha_resolucion DESC", "ndetalle DESC"]
+    cte_consulta = ""
+    params_consulta: List = []
+    columnas_pagina = ""
+    join_pagina = ""
+    if q:
+        cte_consulta = "consulta AS (SELECT websearch_to_tsquery('spanish', %s) AS consulta),"
+        params_consulta = [q]
+        desde += " JOIN textos_sentencias t ON t.ndetalle = s.ndetalle CROSS JOIN consulta c"
+        columnas += ", ts_rank(t.documento, c.consulta) AS rank"
+        orden.insert(0, "rank DESC")
+        filtros_where.append("t.documento @@ c.consulta")
+        columnas_pagina = """, p.rank,
+            ts_headline('spanish', tx.texto, c.consulta, 'MaxFragments=2, MinWords=10, MaxWords=30') AS fragmento"""
+        join_pagina = "LEFT JOIN textos_sentencias tx ON tx.ndetalle = p.ndetalle CROSS JOIN consulta c"
+
+    where_sql = "WHERE " + " AND ".join(filtros_where)
+
+    # con cursor la pagina empieza despues de la ultima fila vista en vez de
+    # saltarse offset filas; el orden es el mismo en ambos modos
+    filtro_pagina = ""
+    params_pagina: List = []
+    if cursor:
+        fecha_cursor, ndetalle_cursor = leer_cursor(cursor)
+        if fecha_cursor is None:
+            # en orden DESC los NULL van primero
+            filtro_pagina = "WHERE (fecha_resolucion IS NULL AND ndetalle < %s) OR fecha_resolucion IS NOT NULL"
+            params_pagina = [ndetalle_cursor]
+        else:
+            filtro_pagina = "WHERE (fecha_resolucion, ndetalle) < (%s, %s)"
+            params_pagina = [fecha_cursor, ndetalle_cursor]
+        offset = 0
+
+    # total y pagina en una sola consulta; el LEFT JOIN devuelve siempre una
+    # fila con el total aunque la pagina este vacia. Se pide una fila de mas
+    # para saber si hay pagina siguiente.
     select_query = f"""
-        SELECT DISTINCT s.ndetalle, s.url, s.clasificacion, s.fecha_resolucion
-        FROM {from_clause}
-        {where_sql}
-        ORDER BY s.fecha_resolucion DESC
-        LIMIT %s OFFSET %s;
+        WITH {cte_consulta}
+        filtradas AS (
+            SELECT {columnas}
+            FROM {desde}
+            {where_sql}
+        ),
+        pagina AS (
+            SELECT *
+            FROM filtradas
+            {filtro_pagina}
+            ORDER BY {", ".join(orden)}
+            LIMIT %s OFFSET %s
+        )
+        SELECT t.total_count, p.fecha_resolucion, p.ndetalle, p.url, p.clasificacion{columnas_pagina}
+        FROM (SELECT COUNT(*) AS total_count FROM filtradas) t
+        LEFT JOIN pagina p ON TRUE
+        {join_pagina}
+        ORDER BY {", ".join("p." + x for x in orden)};
     """
-    cur.execute(select_query, tuple(params + [limit, offset]))
-    filas = cur.fetchall()
-    ndetalles_postgres = [row[0] for row in filas]
-
-    if materia:
-        client = PersistentClient(path="/app/chroma_db")
-        collection = client.get_collection("materias_final_prueba")
 
-        resultados = collection.get(
-            include=["metadatas"],
-            where={"materia": materia}
-        )
+    async with conexion_db() as conn:
+        with medir_sql("search_texto" if q else "search"):
+            cur = await conn.execute(select_query, tuple(params_consulta + params + params_pagina + [limit + 1, offset]))
+            filas = await cur.fetchall()
 
-        # Extraer los ndetalles desde los IDs
-        ndetalles_chroma = set()
-        for id_ in resultados["ids"]:
-            if id_.startswith("id_") and id_.endswith("_materia"):
-                nd = id_[3:-8]  # elimina 'id_' y '_materia'
-                ndetalles_chroma.add(nd)
+    total_count = filas[0][0]
+    filas = [row for row in filas if row[2] is not None]
 
-        if not ndetalles_chroma:
-            return {"total_count": 0, "items": []}
+    next_cursor = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        if not q and filas:
+            next_cursor = crear_cursor(filas[-1][1], filas[-1][2])
 
-        # Añadir filtro en SQL por los ndetalles obtenidos
-        filtros_where.append("s.ndetalle = ANY(%s)")
-        params.append(list(ndetalles_chroma))
+    # las columnas despues de total_count y fecha_resolucion ya vienen en el
+    # orden de las claves: cada item se arma de una vez con zip
+    claves = CLAVES_BUSQUEDA_TEXTO if q else CLAVES_BUSQUEDA
+    items = [dict(zip(claves, row[2:])) for row in filas]
 
-        # Volvemos a generar where_sql con el nuevo filtro
-        where_sql = "WHERE " + " AND ".join(filtros_where)
-
-        # Obtener total filtrado
-        count_query = f"""
-            SELECT COUNT(DISTINCT s.ndetalle)
-            FROM {from_clause}
-            {where_sql};
-        """
-        cur.execute(count_query, tuple(params))
-        total_count = cur.fetchone()[0]
-
-        # Obtener página actual
-        select_query = f"""
-            SELECT DISTINCT s.ndetalle, s.url, s.clasificacion, s.fecha_resolucion
-            FROM {from_clause}
-            {where_sql}
-            ORDER BY s.fecha_resolucion DESC
-            LIMIT %s OFFSET %s;
-        """
-        cur.execute(select_query, tuple(params + [limit, offset]))
-        filas = cur.fetchall()
-    else:
-        # No hay filtro por materia, usar la consulta original
-        select_query = f"""
-            SELECT DISTINCT s.ndetalle, s.url, s.clasificacion, s.fecha_resolucion
-            FROM {from_clause}
-            {where_sql}
-            ORDER BY s.fecha_resolucion DESC
-            LIMIT %s OFFSET %s;
-        """
-        cur.execute(select_query, tuple(params + [limit, offset]))
-        filas = cur.fetchall()
-
-        count_query = f"""
-            SELECT COUNT(DISTINCT s.ndetalle)
-            FROM {from_clause}
-            {where_sql};
-        """
-        cur.execute(count_query, tuple(params))
-        total_count = cur.fetchone()[0]
-
-    cur.close()
-    conn.close()
-
-    items = [
-        {"ndetalle": row[0], "url": row[1], "clasificacion": row[2]}
-        for row in filas
-    ]
+    return ORJSONResponse({
+        "total_count": total_count,
+        "items": items,
+        "next_cursor": next_cursor
+    })
+
+# Busqueda semantica sobre la coleccion de sumilla + parte resolutiva que
+# llena cargar_datos (indexar_semantica). Chroma devuelve los vecinos mas
+# cercanos y los filtros de /search se aplican despues en Postgres; si los
+# filtros descartan demasiados se piden mas vecinos mientras quede presupuesto.
+CHROMA_COLECCION_SEMANTICA = "sentencias_semanticas"
+MODELO_EMBEDDINGS = "all-MiniLM-L6-v2"
+SEMANTICA_PRESUPUESTO_MS = float(os.getenv("SEMANTICA-PRESUPUESTO-MS", "500"))
+SEMANTICA_SOBREMUESTREO = int(os.getenv("SEMANTICA-SOBREMUESTREO", "5"))
+SEMANTICA_MAX_CANDIDATOS = int(os.getenv("SEMANTICA-MAX-CANDIDATOS", "2000"))
+SEMANTICA_MAX_K = 100
+
+_modelo = None
+_modelo_lock = threading.Lock()
+
+def modelo_embeddings():
+    # se carga una sola vez, en la primera busqueda por texto libre
+    global _modelo
+    if _modelo is None:
+        with _modelo_lock:
+            if _modelo is None:
+                from sentence_transformers import SentenceTransformer
+                _modelo = SentenceTransformer(MODELO_EMBEDDINGS)
+    return _modelo
+
+def codificar_texto(texto):
+    return modelo_embeddings().encode([texto], convert_to_numpy=True)[0].tolist()
+
+def coleccion_semantica():
+    try:
+        return chroma_client.get_collection(CHROMA_COLECCION_SEMANTICA)
+    except Exception:
+        raise HTTPException(status_code=503, detail="Índice semántico no disponible.")
+
+async def vecinos_filtrados(coleccion, embedding, k, filtros, organo_detalle=None, excluir=None):
+    inicio = time.perf_counter()
+    filtros_where, params = filtros
+    where_sql = "WHERE " + " AND ".join(filtros_where + ["s.ndetalle = ANY(%s)"])
+    # el organo tambien se filtra dentro de chroma para no gastar candidatos
+    where_chroma = {"organo_detalle": organo_detalle} if organo_detalle else None
+
+    n_resultados = min(k * SEMANTICA_SOBREMUESTREO + (1 if excluir else 0), SEMANTICA_MAX_CANDIDATOS)
+    while True:
+        resultado = await en_ejecutor(
+            coleccion.query,
+            query_embeddings=[embedding],
+            n_results=n_resultados,
+            where=where_chroma,
+            include=["distances"]
+        )
+        candidatos = [
+            (id_[3:-10], distancia)  # elimina 'id_' y '_sentencia'
+            for id_, distancia in zip(resultado["ids"][0], resultado["distances"][0])
+            if id_[3:-10] != excluir
+        ]
+
+        async with conexion_db() as conn:
+            with medir_sql("semantica_filtrado"):
+                cur = await conn.execute(
+                    f"SELECT s.ndetalle, s.url, s.clasificacion FROM sentencias_y_autos s {where_sql}",
+                    tuple(params + [[ndetalle for ndetalle, _ in candidatos]])
+                )
+                filas = {row[0]: row for row in await cur.fetchall()}
+
+        # se conserva el orden por distancia de chroma
+        items = [
+            {"ndetalle": ndetalle, "url": filas[ndetalle][1], "clasificacion": filas[ndetalle][2], "distancia": distancia}
+            for ndetalle, distancia in candidatos
+            if ndetalle in filas
+        ]
+
+        agotado = len(resultado["ids"][0]) < n_resultados or n_resultados >= SEMANTICA_MAX_CANDIDATOS
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+        if len(items) >= k or agotado or latencia_ms >= SEMANTICA_PRESUPUESTO_MS:
+            break
+        n_resultados = min(n_resultados * 4, SEMANTICA_MAX_CANDIDATOS)
+
+    return items[:k], len(items) >= k or agotado
+
+def respuesta_semantica(items, completo, inicio, endpoint):
+    latencia_ms = (time.perf_counter() - inicio) * 1000
+    if latencia_ms > SEMANTICA_PRESUPUESTO_MS:
+        logger.warning(f"{endpoint} tardo {latencia_ms:.0f} ms (presupuesto {SEMANTICA_PRESUPUESTO_MS:.0f} ms)")
+    # completo=False: se acabo el presupuesto antes de juntar k resultados
+    return ORJSONResponse({"items": items, "completo": completo, "latencia_ms": round(latencia_ms, 1)})
+
+@app.get("/similar/{ndetalle}")
+async def sentencias_similares(
+    ndetalle: str,
+    k: int = Query(10, ge=1, le=SEMANTICA_MAX_K),
+    organo_detalle: Optional[str] = Query(None),
+    nombre_juez: Optional[str] = Query(None),
+    fecha_desde: Optional[str] = Query(None),
+    fecha_hasta: Optional[str] = Query(None),
+    clasificacion_fundada: Optional[bool] = False,
+    materia: Optional[str] = Query(None)
+):
+    inicio = time.perf_counter()
+    filtros = await filtros_busqueda(organo_detalle, nombre_juez, fecha_desde, fecha_hasta, clasificacion_fundada, materia)
+    if filtros is None:
+        return respuesta_semantica([], True, inicio, "/similar")
+
+    # el embedding ya guardado de la sentencia sirve como consulta
+    coleccion = await en_ejecutor(coleccion_semantica)
+    guardado = await en_ejecutor(coleccion.get, ids=[f"id_{ndetalle}_sentencia"], include=["embeddings"])
+    if not guardado["ids"]:
+        raise HTTPException(status_code=404, detail="Sentencia sin índice semántico")
+
+    items, completo = await vecinos_filtrados(
+        coleccion, guardado["embeddings"][0], k, filtros, organo_detalle=organo_detalle, excluir=ndetalle
+    )
+    return respuesta_semantica(items, completo, inicio, "/similar")
 
+@app.get("/semantic_search")
+async def busqueda_semantica(
+    texto: str = Query(..., min_length=3),
+    k: int = Query(10, ge=1, le=SEMANTICA_MAX_K),
+    organo_detalle: Optional[str] = Query(None),
+    nombre_juez: Optional[str] = Query(None),
+    fecha_desde: Optional[str] = Query(None),
+    fecha_hasta: Optional[str] = Query(None),
+    clasificacion_fundada: Optional[bool] = False,
+    materia: Optional[str] = Query(None)
+):
+    inicio = time.perf_counter()
+    filtros = await filtros_busqueda(organo_detalle, nombre_juez, fecha_desde, fecha_hasta, clasificacion_fundada, materia)
+    if filtros is None:
+        return respuesta_semantica([], True, inicio, "/semantic_search")
+
+    coleccion = await en_ejecutor(coleccion_semantica)
+    embedding = await en_ejecutor(codificar_texto, texto)
+
+    items, completo = await vecinos_filtrados(coleccion, embedding, k, filtros, organo_detalle=organo_detalle)
+    return respuesta_semantica(items, completo, inicio, "/semantic_search")
+
+# Exportacion completa de una busqueda. Las filas salen de un cursor del
+# servidor en bloques de EXPORTAR_FILAS_POR_BLOQUE y cada bloque se escribe y
+# se envia antes de leer el siguiente, asi la memoria no depende del total.
+# Cada exportacion ocupa una conexion del pool mientras dura: solo corren
+# EXPORTAR_CONCURRENTES a la vez (por defecto la mitad del pool), para que
+# siempre queden conexiones para las consultas cortas.
+EXPORTAR_FILAS_POR_BLOQUE = int(os.getenv("EXPORTAR-FILAS-POR-BLOQUE", "5000"))
+EXPORTAR_TIMEOUT_MS = int(os.getenv("EXPORTAR-TIMEOUT-MS", "300000"))
+EXPORTAR_CONCURRENTES = int(os.getenv("EXPORTAR-CONCURRENTES", str(max(1, DB_POOL_MAX // 2))))
+_exportaciones = asyncio.Semaphore(EXPORTAR_CONCURRENTES)
+COLUMNAS_EXPORTACION = [
+    "ndetalle", "nexpedeinte", "fecha_resolucion", "organo_detalle", "tipo_documento",
+    "clasificacion", "subclasificacion", "sumilla", "url", "jueces", "materia"
+]
+FORMATOS_EXPORTACION = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def materias_de_bloque(coleccion, ndetalles):
+    # materia de cada sentencia del bloque, buscada por id en la coleccion
+    resultados = coleccion.get(ids=[f"id_{nd}_materia" for nd in ndetalles], include=["metadatas"])
     return {
-        "total_count": total_count,
-        "items": items
+        id_[3:-8]: meta.get("materia")  # elimina 'id_' y '_materia'
+        for id_, meta in zip(resultados["ids"], resultados["metadatas"]) if meta
     }
+
+async def bloques_exportacion(select_query, params, materia, coleccion):
+    # con filtro de materia todas las filas la comparten; sin el, se busca la
+    # de cada bloque en Chroma
+    async with _exportaciones, conexion_db() as conn:
+        # el cursor con nombre necesita una transaccion; el timeout del pool
+        # es para consultas cortas, la exportacion tiene el suyo
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL statement_timeout = {EXPORTAR_TIMEOUT_MS}")
+            async with conn.cursor(name="exportacion") as cur:
+                with medir_sql("export"):
+                    await cur.execute(select_query, params)
+                while True:
+                    with medir_sql("export_bloque"):
+                        filas = await cur.fetchmany(EXPORTAR_FILAS_POR_BLOQUE)
+                    if not filas:
+                        break
+                    if materia:
+                        yield [fila + (materia,) for fila in filas]
+                    else:
+                        materias = await en_ejecutor(materias_de_bloque, coleccion, [fila[0] for fila in filas])
+                        yield [fila + (materias.get(fila[0]),) for fila in filas]
+
+def bloque_csv(filas):
+    salida = io.StringIO()
+    csv.writer(salida).writerows(filas)
+    return salida.getvalue().encode("utf-8")
+
+def bloque_jsonl(filas):
+    return b"".join(
+        orjson.dumps(dict(zip(COLUMNAS_EXPORTACION, fila)), default=str) + b"\n"
+        for fila in filas
+    )
+
+class SalidaParquet:
+    # destino de ParquetWriter que entrega lo escrito por partes; tell() sigue
+    # contando el total porque el pie del archivo guarda offsets absolutos
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self):
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+async def exportar(bloques, formato):
+    if formato == "csv":
+        yield bloque_csv([COLUMNAS_EXPORTACION])
+        async for filas in bloques:
+            yield bloque_csv(filas)
+    elif formato == "jsonl":
+        async for filas in bloques:
+            yield bloque_jsonl(filas)
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # un row group por bloque; todo como texto para no depender de los
+        # tipos de las columnas de la tabla
+        esquema = pa.schema([(columna, pa.string()) for columna in COLUMNAS_EXPORTACION])
+        salida = SalidaParquet()
+        with pq.ParquetWriter(salida, esquema) as escritor:
+            async for filas in bloques:
+                columnas = [
+                    pa.array([None if valor is None else str(valor) for valor in columna], pa.string())
+                    for columna in zip(*filas)
+                ]
+                escritor.write_table(pa.Table.from_arrays(columnas, schema=esquema))
+                yield salida.vaciar()
+        yield salida.vaciar()
+
+@app.get("/export")
+async def exportar_sentencias(
+    formato: str = Query("csv"),
+    organo_detalle: Optional[str] = Query(None),
+    nombre_juez: Optional[str] = Query(None),
+    fecha_desde: Optional[str] = Query(None),
+    fecha_hasta: Optional[str] = Query(None),
+    clasificacion_fundada: Optional[bool] = False,
+    materia: Optional[str] = Query(None),
+    q: Optional[str] = Query(None)
+):
+    if formato not in FORMATOS_EXPORTACION:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado. Use: {', '.join(FORMATOS_EXPORTACION)}.")
+    if formato == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Exportación a Parquet no disponible.")
+    # el cupo se toma al empezar a enviar; esta revision evita aceptar una
+    # exportacion que solo quedaria esperando
+    if _exportaciones.locked():
+        raise HTTPException(status_code=503, detail="Demasiadas exportaciones en curso.", headers={"Retry-After": "30"})
+
+    filtros = await filtros_busqueda(organo_detalle, nombre_juez, fecha_desde, fecha_hasta, clasificacion_fundada, materia)
+    if filtros is None:
+        filtros = (["FALSE"], [])
+    filtros_where, params = filtros
+    if q:
+        filtros_where.append("""EXISTS (
+            SELECT 1
+            FROM textos_sentencias t
+            WHERE t.ndetalle = s.ndetalle AND t.documento @@ websearch_to_tsquery('spanish', %s)
+        )""")
+        params.append(q)
+
+    select_query = f"""
+        SELECT
+            s.ndetalle, s.nexpedeinte, s.fecha_resolucion, s.organo_detalle, s.tipo_documento,
+            s.clasificacion, s.subclasificacion, s.sumilla, s.url,
+            (
+                SELECT string_agg(j.nombre_juez, '; ' ORDER BY j.nombre_juez)
+                FROM sentencias_jueces sj
+                JOIN jueces j ON j.codigo = sj.codigo
+                WHERE sj.ndetalle = s.ndetalle
+            ) AS jueces
+        FROM sentencias_y_autos s
+        WHERE {" AND ".join(filtros_where)}
+        ORDER BY s.fecha_resolucion DESC, s.ndetalle DESC
+    """
+
+    coleccion = None if materia else await en_ejecutor(chroma_client.get_collection, CHROMA_COLECCION)
+    return StreamingResponse(
+        exportar(bloques_exportacion(select_query, tuple(params), materia, coleccion), formato),
+        media_type=FORMATOS_EXPORTACION[formato],
+        headers={"Content-Disposition": f'attachment; filename="sentencias.{formato}"'}
+    )
@@ -0,0 +1,266 @@
+# Pruebas de /search contra un Postgres real: la consulta arma total y pagina
+# en un solo statement (CTE + LEFT JOIN) y eso solo se puede comprobar
+# ejecutandolo. Usan la misma base desechable que benchmarks/ (el nombre debe
+# contener "bench") y recrean sus tablas; sin ella se saltan.
+#
+#   env DB-HOST=localhost DB-PORT=5433 DB-NAME=jurisprudencia_bench \
+#       USERNAME-DB=postgres PASSWORD-DB=bench python -m pytest backend/tests
+
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+import asyncio
+import base64
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pytest
+
+if "bench" not in (os.getenv("DB-NAME") or "").lower():
+    pytest.skip("se necesita una base desechable en DB-NAME (con 'bench' en el nombre)", allow_module_level=True)
+
+import httpx
+import psycopg
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+JUECES = [("J001", "ARÉVALO VELA, JAVIER"), ("J002", "YALAN LEAL, JACKELINE"), ("J003", "ATO ALVARADO, MARTIN EDUARDO")]
+ORGANO_NO_PERMITIDO = "SALA CIVIL PERMANENTE"
+TEXTOS = [
+    "se declara fundado el despido arbitrario del trabajador y se ordena su reposicion",
+    "la pension de jubilacion se calcula conforme al decreto ley vigente",
+]
+
+
+def cargar_backend():
+    directorio = tempfile.mkdtemp(prefix="test_busqueda_")
+    os.environ["BUCKET-LOCAL"] = directorio
+    os.environ["CHROMA-PATH"] = os.path.join(directorio, "chroma")
+    sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))  # bucket_local
+    spec = importlib.util.spec_from_file_location("backend_app", os.path.join(RAIZ, "backend", "app.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules["backend_app"] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def generar_sentencias(organos_permitidos):
+    # fechas repetidas (desempate por ndetalle), fechas nulas, sentencias sin
+    # pdf y de un organo no permitido, que /search nunca devuelve
+    sentencias = []
+    for i in range(30):
+        sentencias.append({
+            "ndetalle": str(3000000 + i),
+            "fecha_resolucion": None if i in (3, 17) else date(2024, 6, 30) - timedelta(days=i // 2),
+            "organo_detalle": ORGANO_NO_PERMITIDO if i == 5 else organos_permitidos[i % 2],
+            "url": None if i % 7 == 0 else f"descargas_pdf/CAS-{i},id={3000000 + i}.pdf",
+            "clasificacion": ["fundado", "infundado", "improcedente"][i % 3],
+            "jueces": [JUECES[i % 3], JUECES[(i + 1) % 3]],
+            "texto": TEXTOS[0] if i % 4 == 0 else TEXTOS[1],
+        })
+    return sentencias
+
+
+def crear_datos(conninfo, sentencias):
+    with psycopg.connect(conninfo) as conn:
+        conn.execute("DROP TABLE IF EXISTS textos_sentencias, sentencias_jueces, jueces, sentencias_y_autos CASCADE")
+        conn.execute("""
+            CREATE TABLE sentencias_y_autos (
+                ndetalle TEXT PRIMARY KEY, fecha_resolucion DATE, organo_detalle TEXT, url TEXT, clasificacion TEXT
+            )
+        """)
+        conn.execute("CREATE TABLE jueces (codigo TEXT PRIMARY KEY, nombre_juez TEXT)")
+        conn.execute("CREATE TABLE sentencias_jueces (ndetalle TEXT, codigo TEXT, PRIMARY KEY (ndetalle, codigo))")
+        conn.execute("""
+            CREATE TABLE textos_sentencias (
+                ndetalle TEXT PRIMARY KEY,
+                texto TEXT NOT NULL,
+                documento tsvector GENERATED ALWAYS AS (to_tsvector('spanish', texto)) STORED
+            )
+        """)
+        with conn.cursor() as cur:
+            cur.executemany("INSERT INTO jueces VALUES (%s, %s)", JUECES)
+            cur.executemany("INSERT INTO sentencias_y_autos VALUES (%s, %s, %s, %s, %s)", [
+                (s["ndetalle"], s["fecha_resolucion"], s["organo_detalle"], s["url"], s["clasificacion"])
+                for s in sentencias
+            ])
+            cur.executemany("INSERT INTO sentencias_jueces VALUES (%s, %s)", [
+                (s["ndetalle"], codigo) for s in sentencias for codigo, _ in s["jueces"]
+            ])
+            cur.executemany("INSERT INTO textos_sentencias (ndetalle, texto) VALUES (%s, %s)", [
+                (s["ndetalle"], s["texto"]) for s in sentencias
+            ])
+
+
+def esperados(sentencias, organos_permitidos, organo_detalle=None, nombre_juez=None, clasificacion_fundada=False, palabra=None):
+    # mismo filtro y orden que /search: fecha_resolucion DESC (nulos primero), ndetalle DESC
+    filas = [
+        s for s in sentencias
+        if s["url"]
+        and (s["organo_detalle"] == organo_detalle if organo_detalle else s["organo_detalle"] in organos_permitidos)
+        and (not nombre_juez or nombre_juez in [nombre for _, nombre in s["jueces"]])
+        and (not clasificacion_fundada or s["clasificacion"] in ("fundado", "infundado"))
+        and (not palabra or palabra in s["texto"])
+    ]
+    filas.sort(key=lambda s: (s["fecha_resolucion"] is None, s["fecha_resolucion"] or date.min, s["ndetalle"]), reverse=True)
+    return [s["ndetalle"] for s in filas]
+
+
+@pytest.fixture(scope="module")
+def backend():
+    return cargar_backend()
+
+
+@pytest.fixture(scope="module")
+def sentencias(backend):
+    sentencias = generar_sentencias(backend.LISTA_ORGANO_PERMITIDOS)
+    crear_datos(backend._pool.conninfo, sentencias)
+    return sentencias
+
+
+@pytest.fixture(scope="module")
+def buscar(backend, sentencias):
+    # la app con su ciclo de vida en un loop propio; cada busqueda devuelve la
+    # respuesta y cuantas consultas ejecuto en la base
+    ejecuciones = []
+    conexion_original = backend.conexion_db
+
+    class ConexionContada:
+        def __init__(self, conn):
+            self.conn = conn
+
+        async def execute(self, *args, **kwargs):
+            ejecuciones.append(args[0])
+            return await self.conn.execute(*args, **kwargs)
+
+        def __getattr__(self, nombre):
+            return getattr(self.conn, nombre)
+
+    @asynccontextmanager
+    async def conexion_contada():
+        async with conexion_original() as conn:
+            yield ConexionContada(conn)
+
+    backend.conexion_db = conexion_contada
+    loop = asyncio.new_event_loop()
+    ciclo = backend.app.router.lifespan_context(backend.app)
+    loop.run_until_complete(ciclo.__aenter__())
+    cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=backend.app), base_url="http://test")
+
+    def get(**params):
+        ejecuciones.clear()
+        params = {clave: valor for clave, valor in params.items() if valor is not None}
+        respuesta = loop.run_until_complete(cliente.get("/search", params=params))
+        return respuesta, len(ejecuciones)
+
+    yield get
+
+    loop.run_until_complete(cliente.aclose())
+    loop.run_until_complete(ciclo.__aexit__(None, None, None))
+    loop.close()
+    backend.conexion_db = conexion_original
+
+
+def ndetalles(respuesta):
+    return [item["ndetalle"] for item in respuesta.json()["items"]]
+
+
+def test_sin_resultados(buscar):
+    respuesta, consultas = buscar(fecha_desde="2100-01-01")
+    assert respuesta.status_code == 200
+    assert respuesta.json() == {"total_count": 0, "items": [], "next_cursor": None}
+    assert consultas == 1
+
+
+def test_filtros_y_total(buscar, backend, sentencias):
+    organo = backend.LISTA_ORGANO_PERMITIDOS[1]
+    nombre_juez = JUECES[0][1]
+    respuesta, consultas = buscar(organo_detalle=organo, nombre_juez=nombre_juez, clasificacion_fundada="true", limit=100)
+    esperado = esperados(sentencias, backend.LISTA_ORGANO_PERMITIDOS, organo, nombre_juez, True)
+    assert esperado
+    assert respuesta.json()["total_count"] == len(esperado)
+    assert ndetalles(respuesta) == esperado
+    assert consultas == 1
+
+
+@pytest.mark.parametrize("offset", [0, 5, 20, 1000])
+def test_offset(buscar, backend, sentencias, offset):
+    esperado = esperados(sentencias, backend.LISTA_ORGANO_PERMITIDOS)
+    respuesta, consultas = buscar(limit=5, offset=offset)
+    cuerpo = respuesta.json()
+    # el total no depende de la pagina, aunque esta quede vacia
+    assert cuerpo["total_count"] == len(esperado)
+    assert ndetalles(respuesta) == esperado[offset:offset + 5]
+    assert (cuerpo["next_cursor"] is not None) == (len(esperado) > offset + 5)
+    assert consultas == 1
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7])
+def test_cursor_recorre_todo(buscar, backend, sentencias, limit):
+    # las fechas nulas van primero en orden DESC; con limit=1 el cursor cae
+    # sobre una de ellas
+    esperado = esperados(sentencias, backend.LISTA_ORGANO_PERMITIDOS)
+    vistos, cursor, paginas = [], None, 0
+    while True:
+        respuesta, consultas = buscar(limit=limit, cursor=cursor)
+        cuerpo = respuesta.json()
+        assert consultas == 1
+        assert cuerpo["total_count"] == len(esperado)
+        vistos += ndetalles(respuesta)
+        paginas += 1
+        cursor = cuerpo["next_cursor"]
+        if cursor is None:
+            break
+    assert vistos == esperado
+    assert paginas == -(-len(esperado) // limit)
+
+
+@pytest.mark.parametrize("cursor", [
+    "no-es-un-cursor",
+    base64.urlsafe_b64encode(b"[1,2]").decode(),
+    base64.urlsafe_b64encode(b'["2024-13-40","3000001"]').decode(),
+    base64.urlsafe_b64encode(b'["2024-01-01","3000001",3]').decode(),
+    base64.urlsafe_b64encode(b'{"a":1}').decode(),
+])
+def test_cursor_invalido(buscar, cursor):
+    respuesta, consultas = buscar(cursor=cursor)
+    assert respuesta.status_code == 400
+    assert consultas == 0
+
+
+@pytest.mark.parametrize("params", [{"limit": 0}, {"limit": -1}, {"offset": -1}])
+def test_limites_invalidos(buscar, params):
+    respuesta, consultas = buscar(**params)
+    assert respuesta.status_code == 422
+    assert consultas == 0
+
+
+def test_busqueda_por_texto(buscar, backend, sentencias):
+    esperado = esperados(sentencias, backend.LISTA_ORGANO_PERMITIDOS, palabra="despido")
+    respuesta, consultas = buscar(q="despido", limit=3)
+    cuerpo = respuesta.json()
+    assert consultas == 1
+    assert cuerpo["total_count"] == len(esperado)
+    assert cuerpo["next_cursor"] is None
+    assert len(cuerpo["items"]) == min(3, len(esperado))
+    assert set(ndetalles(respuesta)) <= set(esperado)
+    rangos = [item["rank"] for item in cuerpo["items"]]
+    assert rangos == sorted(rangos, reverse=True)
+    assert all("<b>" in item["fragmento"] for item in cuerpo["items"])
+
+    # todas las paginas juntas son exactamente las que contienen la palabra
+    todos, _ = buscar(q="despido", limit=100)
+    assert sorted(ndetalles(todos)) == sorted(esperado)
+
+
+def test_busqueda_por_texto_sin_resultados(buscar):
+    respuesta, consultas = buscar(q="inexistentepalabra")
+    assert respuesta.json() == {"total_count": 0, "items": [], "next_cursor": None}
+    assert consultas == 1
+
+
+def test_texto_con_cursor(buscar):
+    respuesta, consultas = buscar(q="despido", cursor="x")
+    assert respuesta.status_code == 400
+    assert consultas == 0
@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+import hashlib
+import os
+
+
+# Sustituto del bucket de GCS sobre una carpeta local, con solo lo que usan
+# cargar_datos y el backend: list_blobs, blob, get_blob, open,
+# download_as_bytes/text y generate_signed_url. El nombre del blob es la ruta
+# relativa dentro de la carpeta.
+class BlobLocal:
+
+    def __init__(self, directorio, name):
+        self.name = name
+        self.ruta = os.path.join(directorio, *name.split("/"))
+
+    def _estado(self):
+        return os.stat(self.ruta)
+
+    @property
+    def updated(self):
+        return datetime.fromtimestamp(self._estado().st_mtime, tz=timezone.utc)
+
+    @property
+    def generation(self):
+        return self._estado().st_mtime_ns
+
+    @property
+    def etag(self):
+        estado = self._estado()
+        return hashlib.sha1(f"{self.name}:{estado.st_mtime_ns}:{estado.st_size}".encode()).hexdigest()
+
+    @property
+    def size(self):
+        return self._estado().st_size
+
+    def exists(self, timeout=None):
+        return os.path.isfile(self.ruta)
+
+    def open(self, mode="rb"):
+        return open(self.ruta, mode)
+
+    def download_as_bytes(self, timeout=None):
+        with open(self.ruta, "rb") as f:
+            return f.read()
+
+    def download_as_text(self, timeout=None, encoding="utf-8"):
+        return self.download_as_bytes(timeout=timeout).decode(encoding)
+
+    def generate_signed_url(self, version="v4", expiration=None, method="GET"):
+        segundos = int(expiration.total_seconds()) if expiration is not None else 0
+        return f"file://{os.path.abspath(self.ruta)}?expira={segundos}"
+
+
+class BucketLocal:
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.name = os.path.basename(os.path.abspath(directorio))
+
+    def blob(self, nombre):
+        return BlobLocal(self.directorio, nombre)
+
+    def get_blob(self, nombre, timeout=None):
+        blob = self.blob(nombre)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix=""):
+        # en orden alfabetico, como los lista GCS
+        nombres = []
+        for raiz, _, archivos in os.walk(self.directorio):
+            for archivo in archivos:
+                nombre = os.path.relpath(os.path.join(raiz, archivo), self.directorio).replace(os.sep, "/")
+                if nombre.startswith(prefix):
+                    nombres.append(nombre)
+        return [self.blob(nombre) for nombre in sorted(nombres)]
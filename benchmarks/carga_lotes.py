@@ -0,0 +1,122 @@
+# Compara en filas/s la carga anterior del json (un INSERT por sentencia, juez
+# y relacion, commit cada 20 sentencias) con cargar_json_a_database_por_lotes
+# sobre la misma base desechable que ejecutar.py (DB-HOST, DB-NAME, ...; el
+# nombre debe contener "bench" salvo --permitir-db). Las tablas se recrean
+# antes de cada carga y al final se comprueba que ambas dejan las mismas filas.
+#
+#   env DB-HOST=localhost DB-PORT=5433 DB-NAME=jurisprudencia_bench \
+#       USERNAME-DB=postgres PASSWORD-DB=bench python benchmarks/carga_lotes.py --sentencias 5000
+
+import argparse
+from datetime import date, timedelta
+import os
+import random
+import tempfile
+import time
+
+from ejecutar import RAIZ, cargar_modulo, configurar_entorno, preparar_base, verificar_base
+from corpus import ORGANOS, MATERIAS, JUECES
+
+
+def generar_items(num_sentencias, semilla):
+    # mismos campos que el json de corpus.py, sin generar los pdfs
+    rnd = random.Random(semilla)
+    items = []
+    for i in range(num_sentencias):
+        fecha = date(2023, 1, 1) + timedelta(days=rnd.randint(0, 700))
+        items.append({
+            "ndetalle": str(2000000 + i),
+            "fechaResolucion": fecha.isoformat(),
+            "anioResolucion": str(fecha.year),
+            "organoDetalle": rnd.choice(ORGANOS),
+            "nexpediente": f"{rnd.randint(100, 99999)}-{fecha.year}",
+            "tipoDocumento": "SENTENCIA",
+            "descDocumento": "SENTENCIA CASATORIA",
+            "sumilla": f"Sobre {rnd.choice(MATERIAS)}",
+            "magistrados": [{"codigo": codigo, "valor": nombre} for codigo, nombre in rnd.sample(JUECES, 3)],
+        })
+    return items
+
+
+def cargar_json_a_database_anterior(cargar, data_filtrada):
+    # copia de la implementacion anterior, como referencia
+    conn = cargar.get_db_connection()
+    cur = conn.cursor()
+
+    for i, item in enumerate(data_filtrada):
+        cargar.logger.info(f"[INFO] Procesadas {i}/{len(data_filtrada)} sentencias -> {i}")
+
+        cur.execute(f"""
+            INSERT INTO sentencias_y_autos ({cargar.COLUMNAS_SENTENCIA})
+            VALUES ({", ".join(["%s"] * len(cargar.CAMPOS_SENTENCIA))})
+            ON CONFLICT (ndetalle) DO NOTHING;
+        """, cargar.fila_sentencia(item))
+
+        for codigo, nombre in cargar.jueces_de_sentencia(item):
+            cur.execute("""
+                INSERT INTO jueces (codigo, nombre_juez)
+                VALUES (%s, %s)
+                ON CONFLICT (codigo) DO NOTHING;
+            """, (codigo, nombre))
+
+            cur.execute("""
+                INSERT INTO sentencias_jueces (ndetalle, codigo)
+                VALUES (%s, %s)
+                ON CONFLICT DO NOTHING;
+            """, (item["ndetalle"], codigo))
+
+        if i % 20 == 0:
+            conn.commit()
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def contenido_tablas(cargar):
+    conn = cargar.get_db_connection()
+    cur = conn.cursor()
+    contenido = {}
+    for tabla in ("sentencias_y_autos", "jueces", "sentencias_jueces"):
+        cur.execute(f"SELECT * FROM {tabla} ORDER BY 1, 2;")
+        contenido[tabla] = cur.fetchall()
+    cur.close()
+    conn.close()
+    return contenido
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga del json fila por fila contra por lotes")
+    parser.add_argument("--sentencias", type=int, default=5000)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--tamano-lote", type=int, default=1000)
+    parser.add_argument("--directorio", help="carpeta de trabajo (por defecto una temporal)")
+    parser.add_argument("--permitir-db", action="store_true", help="permitir una base sin 'bench' en el nombre")
+    args = parser.parse_args()
+
+    args.directorio = os.path.abspath(args.directorio or tempfile.mkdtemp(prefix="bench_carga_lotes_"))
+    configurar_entorno(args)
+    os.chdir(args.directorio)  # logs.log de cargar_datos queda en la carpeta de trabajo
+    cargar = cargar_modulo("cargar_app", os.path.join(RAIZ, "cargar_datos", "app.py"))
+    verificar_base(args)
+
+    items = generar_items(args.sentencias, args.semilla)
+    cargas = (
+        ("fila por fila", lambda: cargar_json_a_database_anterior(cargar, items)),
+        (f"por lotes de {args.tamano_lote}", lambda: cargar.cargar_json_a_database_por_lotes(items, args.tamano_lote)),
+    )
+    contenidos = []
+    for nombre, funcion in cargas:
+        preparar_base(cargar)
+        inicio = time.perf_counter()
+        funcion()
+        segundos = time.perf_counter() - inicio
+        contenidos.append(contenido_tablas(cargar))
+        print(f"{nombre}: {len(items)} sentencias en {segundos:.2f}s ({len(items) / segundos:.0f} filas/s)")
+
+    if contenidos[0] != contenidos[1]:
+        raise SystemExit("Las dos cargas dejan filas distintas")
+
+
+if __name__ == "__main__":
+    main()
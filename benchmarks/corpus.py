@@ -0,0 +1,156 @@
+from datetime import date, timedelta
+import json
+import os
+import random
+
+# Corpus sintetico y reproducible (misma semilla, mismos archivos) con la forma
+# que espera cargar_datos: un json en data/ con la lista de sentencias y un pdf
+# por sentencia en descargas_pdf/ con el encabezado que lee
+# clasificar_por_materias y la formula de decision que lee la clasificacion.
+
+ORGANOS = [
+    "SEGUNDA SALA DE DERECHO CONSTITUCIONAL Y SOCIAL TRANSITORIA",
+    "CUARTA SALA DE DERECHO CONSTITUCIONAL Y SOCIAL TRANSITORIA",
+    "PRIMERA SALA DE DERECHO CONSTITUCIONAL Y SOCIAL TRANSITORIA",
+    "TERCERA SALA DE DERECHO CONSTITUCIONAL Y SOCIAL TRANSITORIA",
+]
+
+MATERIAS = [
+    "reintegro de remuneraciones",
+    "pago de beneficios sociales",
+    "nulidad de resolucion administrativa",
+    "otorgamiento de pension de jubilacion",
+    "desnaturalizacion de contrato",
+    "indemnizacion por despido arbitrario",
+]
+
+JUECES = [
+    ("J001", "ARÉVALO VELA, JAVIER"),
+    ("J002", "ESPINOZA MONTOYA, CECILIA LEONOR"),
+    ("J003", "JIMENEZ LA ROSA, PERU VALENTIN"),
+    ("J004", "ALVARADO PALACIOS, EDITH IRMA"),
+    ("J005", "CARDENAS SALCEDO, ANGELA GRACIELA"),
+    ("J006", "DE LA ROSA BEDRIÑANA, MARIEM VICKY"),
+    ("J007", "YALAN LEAL, JACKELINE"),
+    ("J008", "CASTILLO LEON, VICTOR ANTONIO"),
+    ("J009", "CARLOS CASAS, ELISA VILMA"),
+    ("J010", "ATO ALVARADO, MARTIN EDUARDO"),
+]
+
+# (formula de decision, peso): None deja el pdf sin decision ("desconocido")
+DECISIONES = [
+    ("DECLARARON FUNDADO", 4),
+    ("DECLARARON INFUNDADO", 4),
+    ("DECLARARON IMPROCEDENTE", 2),
+    ("DECLARARON PROCEDENTE", 1),
+    (None, 1),
+]
+
+PALABRAS = (
+    "recurso casacion sentencia demanda demandante demandada trabajador empleador "
+    "remuneracion pension jubilacion contrato despido indemnizacion beneficios sociales "
+    "resolucion administrativa nulidad vulneracion derecho debido proceso motivacion "
+    "constitucion articulo ley decreto supremo tribunal sala instancia fundamento "
+    "considerando interpretacion aplicacion norma material procesal vinculante precedente"
+).split()
+
+LINEAS_POR_PAGINA = 48
+
+
+def _escapar(texto):
+    return texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def generar_pdf(paginas):
+    # pdf minimo de texto (Helvetica, WinAnsi) que pdfplumber puede leer:
+    # catalogo, arbol de paginas, fuente y una pagina + contenido por pagina
+    objetos = {1: None, 2: None, 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"}
+    hijos = []
+    for i, lineas in enumerate(paginas):
+        num_pagina, num_contenido = 4 + 2 * i, 5 + 2 * i
+        texto = "BT /F1 10 Tf 14 TL 50 800 Td " + " ".join(f"({_escapar(linea)}) Tj T*" for linea in lineas) + " ET"
+        contenido = texto.encode("cp1252", errors="replace")
+        objetos[num_contenido] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(contenido), contenido)
+        objetos[num_pagina] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % num_contenido
+        )
+        hijos.append(b"%d 0 R" % num_pagina)
+    objetos[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objetos[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(hijos), len(paginas))
+
+    salida = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for numero in sorted(objetos):
+        offsets[numero] = len(salida)
+        salida += b"%d 0 obj\n%s\nendobj\n" % (numero, objetos[numero])
+    inicio_xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    for numero in sorted(objetos):
+        salida += b"%010d 00000 n \n" % offsets[numero]
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+    return bytes(salida)
+
+
+def _parrafo(rnd, palabras):
+    return " ".join(rnd.choice(PALABRAS) for _ in range(palabras))
+
+
+def paginas_sentencia(rnd, organo, expediente, materia, decision, num_paginas):
+    queja = rnd.random() < 0.05
+    encabezado = [
+        "CORTE SUPREMA DE JUSTICIA DE LA REPUBLICA",
+        organo,
+        f"{'QUEJA' if queja else 'CASACION'} N. {expediente} LIMA",
+        "MATERIA:",
+        materia.upper() + (" Y OTROS" if rnd.random() < 0.2 else ""),
+    ]
+    lineas = encabezado + [_parrafo(rnd, 12) for _ in range(LINEAS_POR_PAGINA * num_paginas - len(encabezado))]
+
+    # la decision va en el ultimo tercio del documento, como en las reales
+    if decision:
+        posicion = rnd.randint(int(len(lineas) * 0.75), len(lineas) - 3)
+        lineas[posicion] = f"{decision} el recurso de casacion interpuesto por la parte demandante"
+        lineas[posicion + 1] = "en consecuencia CASARON la sentencia de vista y actuando en sede de instancia"
+    return [lineas[i:i + LINEAS_POR_PAGINA] for i in range(0, len(lineas), LINEAS_POR_PAGINA)]
+
+
+def generar_corpus(directorio, num_sentencias, semilla=0, paginas=(2, 8), ndetalle_inicial=2000000):
+    rnd = random.Random(semilla)
+    os.makedirs(os.path.join(directorio, "data"), exist_ok=True)
+    os.makedirs(os.path.join(directorio, "descargas_pdf"), exist_ok=True)
+
+    formulas = [formula for formula, peso in DECISIONES for _ in range(peso)]
+    fecha_base = date(2023, 1, 1)
+    items = []
+    for i in range(num_sentencias):
+        ndetalle = str(ndetalle_inicial + i)
+        organo = rnd.choice(ORGANOS)
+        materia = rnd.choice(MATERIAS)
+        expediente = f"{rnd.randint(100, 99999)}-{rnd.choice([2021, 2022, 2023])}"
+        fecha = fecha_base + timedelta(days=rnd.randint(0, 700))
+        jueces = rnd.sample(JUECES, 3)
+
+        pdf = generar_pdf(paginas_sentencia(
+            rnd, organo, expediente, materia, rnd.choice(formulas), rnd.randint(*paginas)
+        ))
+        with open(os.path.join(directorio, "descargas_pdf", f"CAS-{expediente},id={ndetalle}.pdf"), "wb") as f:
+            f.write(pdf)
+
+        items.append({
+            "ndetalle": ndetalle,
+            "fechaResolucion": fecha.isoformat(),
+            "anioResolucion": str(fecha.year),
+            "organoDetalle": organo,
+            "nexpediente": expediente,
+            "tipoDocumento": "SENTENCIA",
+            "descDocumento": "SENTENCIA CASATORIA",
+            "sumilla": f"Sobre {materia}: {_parrafo(rnd, 20)}",
+            "magistrados": [{"codigo": codigo, "valor": nombre} for codigo, nombre in jueces],
+        })
+
+    # el json fuente viene en bloques con una "lista" de sentencias cada uno
+    bloques = [{"lista": items[i:i + 100]} for i in range(0, len(items), 100)]
+    with open(os.path.join(directorio, "data", "sentencias.json"), "w", encoding="utf-8") as f:
+        json.dump(bloques, f, ensure_ascii=False)
+    return items
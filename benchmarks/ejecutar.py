@@ -0,0 +1,325 @@
+# Benchmark reproducible de la carga (cargar_datos) y de los endpoints del
+# backend sin el bucket ni la base de produccion:
+#
+#   1. genera un corpus sintetico (pdfs + json fuente) en una carpeta que hace
+#      de bucket (BUCKET-LOCAL),
+#   2. recrea las tablas en una base Postgres desechable (DB-HOST, DB-NAME, USERNAME-DB, ...;
+#      el nombre debe contener "bench" salvo --permitir-db),
+#   3. ejecuta main() de cargar_datos con Chroma en una carpeta temporal y lee
+#      las metricas por etapa,
+#   4. lanza peticiones concurrentes a cada endpoint del backend (en el mismo
+#      proceso o contra --url) y mide req/s, p50 y p99,
+#   5. guarda el resultado en --salida y lo compara con --comparar.
+#
+#   python benchmarks/ejecutar.py --sentencias 200 --salida base.json
+#   python benchmarks/ejecutar.py --sentencias 200 --comparar base.json
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(DIRECTORIO)
+sys.path[:0] = [DIRECTORIO, os.path.join(RAIZ, "cargar_datos")]
+
+from corpus import generar_corpus, ORGANOS, MATERIAS, JUECES, PALABRAS  # noqa: E402
+
+TABLAS = ["estadisticas_jueces", "estadisticas_pendientes", "textos_sentencias", "sentencias_jueces", "jueces", "sentencias_y_autos"]
+
+
+def cargar_modulo(nombre, ruta):
+    # cargar_datos/app.py y backend/app.py se llaman igual: se importan con
+    # nombres distintos
+    spec = importlib.util.spec_from_file_location(nombre, ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def configurar_entorno(args):
+    os.environ["BUCKET-LOCAL"] = os.path.join(args.directorio, "bucket")
+    os.environ["CHROMA-PATH"] = os.path.join(args.directorio, "chroma")
+    os.environ["CACHE-PDF-DIR"] = os.path.join(args.directorio, "cache_pdf")
+    # vacias y no borradas: asi load_dotenv no las completa desde un .env y el
+    # benchmark nunca avisa ni exporta a servicios reales
+    for variable in ("URL-API", "METRICAS-ARCHIVO", "METRICAS-PUSHGATEWAY"):
+        os.environ[variable] = ""
+
+
+def verificar_base(args):
+    nombre = os.getenv("DB-NAME") or ""
+    if "bench" not in nombre.lower() and not args.permitir_db:
+        sys.exit(f"La base '{nombre}' no parece desechable (se borran sus tablas). Use una con 'bench' en el nombre o --permitir-db.")
+
+
+def preparar_base(cargar):
+    conn = cargar.get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS " + ", ".join(TABLAS) + " CASCADE;")
+    columnas = ",\n".join(
+        f"{columna} {'DATE' if columna == 'fecha_resolucion' else 'TEXT'}"
+        for columna, _ in cargar.CAMPOS_SENTENCIA if columna != "ndetalle"
+    )
+    cur.execute(f"CREATE TABLE sentencias_y_autos (ndetalle TEXT PRIMARY KEY, {columnas});")
+    cur.execute("CREATE TABLE jueces (codigo TEXT PRIMARY KEY, nombre_juez TEXT);")
+    cur.execute("""
+        CREATE TABLE sentencias_jueces (
+            ndetalle TEXT REFERENCES sentencias_y_autos (ndetalle),
+            codigo TEXT REFERENCES jueces (codigo),
+            PRIMARY KEY (ndetalle, codigo)
+        );
+    """)
+    cur.execute("CREATE INDEX ON sentencias_y_autos (fecha_resolucion DESC, ndetalle DESC);")
+    cur.execute("CREATE INDEX ON sentencias_jueces (codigo);")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def sembrar_materias(cargar):
+    # clasificar_por_materias copia la materia del vecino mas cercano: la
+    # coleccion necesita ejemplos etiquetados antes de la primera carga
+    embeddings = cargar.model.encode(MATERIAS, convert_to_numpy=True).tolist()
+    cargar.collection.add(
+        ids=[f"semilla_{i}" for i in range(len(MATERIAS))],
+        documents=MATERIAS,
+        embeddings=embeddings,
+        metadatas=[{"parte": "semilla", "materia": materia} for materia in MATERIAS],
+    )
+
+
+def ejecutar_carga(args):
+    cargar = cargar_modulo("cargar_app", os.path.join(RAIZ, "cargar_datos", "app.py"))
+    import metricas
+
+    verificar_base(args)
+    preparar_base(cargar)
+    sembrar_materias(cargar)
+
+    inicio = time.perf_counter()
+    cargar.main()
+    return {"segundos": time.perf_counter() - inicio, "etapas": metricas.etapas_metricas()}
+
+
+def percentil(valores, q):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(q * (len(ordenados) - 1)))]
+
+
+def rutas_endpoints(items, peticiones, rnd):
+    ndetalles = [item["ndetalle"] for item in items]
+    jueces = [nombre for _, nombre in JUECES]
+
+    def busqueda(**extra):
+        params = {"limit": 100, "offset": rnd.choice([0, 0, 100, 200])}
+        if rnd.random() < 0.5:
+            params["organo_detalle"] = rnd.choice(ORGANOS)
+        if rnd.random() < 0.3:
+            params["nombre_juez"] = rnd.choice(jueces)
+        if rnd.random() < 0.5:
+            params.update(fecha_desde="2023-06-01", fecha_hasta="2024-06-30")
+        if rnd.random() < 0.3:
+            params["clasificacion_fundada"] = "true"
+        params.update(extra)
+        return "/search?" + urlencode(params)
+
+    def texto():
+        return " ".join(rnd.sample(PALABRAS, 2))
+
+    return {
+        "filters": ["/filters"] * peticiones,
+        "search": [busqueda() for _ in range(peticiones)],
+        "search_materia": [busqueda(materia=rnd.choice(MATERIAS)) for _ in range(peticiones)],
+        "search_texto": [busqueda(q=texto(), offset=0) for _ in range(peticiones)],
+        "statistics": [
+            "/statistics?" + urlencode({"lista_jueces": rnd.sample(jueces, 5), "fecha_desde": "2023-01-01"}, doseq=True)
+            for _ in range(peticiones)
+        ],
+        "descargar": [f"/descargar/{rnd.choice(ndetalles)}" for _ in range(peticiones)],
+        "descargar_lote": [
+            "/descargar?" + urlencode({"ndetalles": rnd.sample(ndetalles, min(100, len(ndetalles)))}, doseq=True)
+            for _ in range(peticiones)
+        ],
+        "similar": [f"/similar/{rnd.choice(ndetalles)}?k=10" for _ in range(peticiones)],
+        "semantic_search": ["/semantic_search?" + urlencode({"texto": texto(), "k": 10}) for _ in range(peticiones)],
+        "export_csv": ["/export?formato=csv"] * max(1, peticiones // 20),
+        "export_parquet": ["/export?formato=parquet"] * max(1, peticiones // 20),
+    }
+
+
+async def medir_endpoint(cliente, rutas, concurrencia):
+    latencias = []
+    errores = 0
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def pedir(ruta):
+        nonlocal errores
+        async with semaforo:
+            inicio = time.perf_counter()
+            respuesta = await cliente.get(ruta)
+            latencias.append(time.perf_counter() - inicio)
+            if respuesta.status_code >= 400:
+                errores += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(pedir(ruta) for ruta in rutas))
+    duracion = time.perf_counter() - inicio
+    return {
+        "peticiones": len(rutas),
+        "errores": errores,
+        "por_segundo": len(rutas) / duracion,
+        "media": sum(latencias) / len(latencias),
+        "p50": percentil(latencias, 0.5),
+        "p99": percentil(latencias, 0.99),
+    }
+
+
+async def medir_backend(args, items):
+    import httpx
+
+    rutas = rutas_endpoints(items, args.peticiones, random.Random(args.semilla))
+    if args.endpoints:
+        rutas = {nombre: lista for nombre, lista in rutas.items() if nombre in args.endpoints}
+    if args.url:
+        cliente = httpx.AsyncClient(base_url=args.url, timeout=120)
+        ciclo = None
+    else:
+        # la app en este mismo proceso, sin red ni uvicorn de por medio
+        backend = cargar_modulo("backend_app", os.path.join(RAIZ, "backend", "app.py"))
+        cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=backend.app), base_url="http://bench", timeout=120)
+        ciclo = backend.app.router.lifespan_context(backend.app)
+
+    resultados = {}
+    async with cliente:
+        if ciclo:
+            await ciclo.__aenter__()
+        try:
+            # una pasada corta para calentar caches, modelo y conexiones
+            for lista in rutas.values():
+                await cliente.get(lista[0])
+            for nombre, lista in rutas.items():
+                resultados[nombre] = await medir_endpoint(cliente, lista, args.concurrencia)
+        finally:
+            if ciclo:
+                await ciclo.__aexit__(None, None, None)
+    return resultados
+
+
+def imprimir_tabla(titulo, encabezados, filas):
+    anchos = [max(len(str(x)) for x in columna) for columna in zip(encabezados, *filas)]
+    print(f"\n{titulo}")
+    for fila in [encabezados] + filas:
+        print("  " + "  ".join(str(valor).rjust(ancho) if i else str(valor).ljust(ancho) for i, (valor, ancho) in enumerate(zip(fila, anchos))))
+
+
+def imprimir_resultados(resultado):
+    carga = resultado.get("carga")
+    if carga:
+        filas = []
+        for nombre, etapa in sorted(carga["etapas"].items(), key=lambda x: -x[1]["segundos"]):
+            por_segundo = etapa["elementos"] / etapa["segundos"] if etapa["elementos"] and etapa["segundos"] else None
+            filas.append([
+                nombre, f"{etapa['operaciones']:.0f}", f"{etapa['segundos']:.2f}",
+                f"{1000 * etapa['p50']:.1f}" if etapa["operaciones"] else "-",
+                f"{1000 * etapa['p99']:.1f}" if etapa["operaciones"] else "-",
+                f"{etapa['elementos']:.0f}", f"{por_segundo:.1f}" if por_segundo else "-",
+            ])
+        imprimir_tabla(
+            f"Carga: {carga['segundos']:.1f}s en total (p50/p99 aproximados por buckets)",
+            ["etapa", "ops", "seg", "p50 ms", "p99 ms", "elementos", "elem/s"], filas
+        )
+    endpoints = resultado.get("endpoints")
+    if endpoints:
+        filas = [
+            [nombre, r["peticiones"], f"{r['por_segundo']:.1f}", f"{1000 * r['p50']:.1f}", f"{1000 * r['p99']:.1f}", r["errores"]]
+            for nombre, r in endpoints.items()
+        ]
+        imprimir_tabla("Backend", ["endpoint", "req", "req/s", "p50 ms", "p99 ms", "errores"], filas)
+
+
+def comparar(actual, anterior, tolerancia):
+    # regresion: p99 peor en mas de la tolerancia (ignorando lo que tarda menos
+    # de 1 ms) o menos req/s en los endpoints
+    regresiones = []
+    pares = [
+        ("etapa", actual.get("carga", {}).get("etapas", {}), anterior.get("carga", {}).get("etapas", {})),
+        ("endpoint", actual.get("endpoints", {}), anterior.get("endpoints", {})),
+    ]
+    for tipo, nuevos, viejos in pares:
+        for nombre, nuevo in nuevos.items():
+            viejo = viejos.get(nombre)
+            if not viejo or "p99" not in nuevo or "p99" not in viejo:
+                continue
+            if nuevo["p99"] > 0.001 and nuevo["p99"] > viejo["p99"] * (1 + tolerancia):
+                regresiones.append(f"{tipo} {nombre}: p99 {1000 * viejo['p99']:.1f} -> {1000 * nuevo['p99']:.1f} ms")
+            if "por_segundo" in nuevo and nuevo["por_segundo"] < viejo["por_segundo"] * (1 - tolerancia):
+                regresiones.append(f"{tipo} {nombre}: {viejo['por_segundo']:.1f} -> {nuevo['por_segundo']:.1f} req/s")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline de cargar_datos y del backend")
+    parser.add_argument("--sentencias", type=int, default=200, help="tamano del corpus sintetico")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--paginas", type=int, nargs=2, default=(2, 8), metavar=("MIN", "MAX"))
+    parser.add_argument("--directorio", help="carpeta de trabajo (por defecto una temporal)")
+    parser.add_argument("--solo", choices=["todo", "carga", "backend"], default="todo")
+    parser.add_argument("--peticiones", type=int, default=200, help="peticiones por endpoint")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--endpoints", nargs="*", help="medir solo estos endpoints")
+    parser.add_argument("--url", help="medir un backend ya levantado en vez de la app en proceso")
+    parser.add_argument("--salida", help="guardar el resultado en este json")
+    parser.add_argument("--comparar", help="json de una ejecucion anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    parser.add_argument("--permitir-db", action="store_true", help="permitir una base sin 'bench' en el nombre")
+    args = parser.parse_args()
+
+    # rutas absolutas antes del chdir: --salida y --comparar son relativas a
+    # donde se lanza el benchmark, no a la carpeta de trabajo
+    args.directorio = os.path.abspath(args.directorio or tempfile.mkdtemp(prefix="bench_jurisprudencia_"))
+    args.salida = args.salida and os.path.abspath(args.salida)
+    args.comparar = args.comparar and os.path.abspath(args.comparar)
+    os.makedirs(args.directorio, exist_ok=True)
+    configurar_entorno(args)
+    os.chdir(args.directorio)  # logs.log de cargar_datos queda en la carpeta de trabajo
+
+    # el corpus es determinista: con --solo backend se regenera igual que en
+    # la carga anterior sobre el mismo --directorio
+    items = generar_corpus(os.environ["BUCKET-LOCAL"], args.sentencias, args.semilla, tuple(args.paginas))
+    resultado = {
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")},
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if args.solo in ("todo", "carga"):
+        resultado["carga"] = ejecutar_carga(args)
+    if args.solo in ("todo", "backend"):
+        if not args.url:
+            verificar_base(args)
+        resultado["endpoints"] = asyncio.run(medir_backend(args, items))
+
+    imprimir_resultados(resultado)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(resultado, json.load(f), args.tolerancia)
+        if regresiones:
+            print("\nRegresiones:")
+            for regresion in regresiones:
+                print(f"  {regresion}")
+            sys.exit(1)
+        print("\nSin regresiones respecto a", args.comparar)
+
+
+if __name__ == "__main__":
+    main()
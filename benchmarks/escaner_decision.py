@@ -0,0 +1,133 @@
+# Comprueba que estructura_pdf (un solo escaner compilado) da lo mismo que la
+# implementacion anterior (un re.findall + rfind por patron) y mide cuanto
+# tarda cada una por documento.
+#
+#   python benchmarks/escaner_decision.py --documentos 3000
+#
+# La unica diferencia esperada: cuando un mismo patron coincide con textos
+# distintos (por ejemplo "DECLARARON FUNDADO" y "DECLARARON\nFUNDADO"), la
+# version anterior tomaba el rfind del que saliera ultimo al recorrer un set,
+# que depende del hash de los strings; la nueva toma siempre la ultima
+# coincidencia. Esos casos se verifican aparte y no cuentan como error.
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [DIRECTORIO, os.path.join(os.path.dirname(DIRECTORIO), "cargar_datos")]
+
+from corpus import ORGANOS, MATERIAS, DECISIONES, PALABRAS, paginas_sentencia  # noqa: E402
+from clasificacion import (  # noqa: E402
+    PRIMERAS_PALABRAS, SEGUNDAS_PALABRAS, combinar_listas_regex, estructura_pdf
+)
+
+SEPARADORES = [" ", "  ", "\n", "\t", ": ", ":\n", " \n "]
+
+
+def estructura_pdf_anterior(contenido):
+    # copia de la implementacion anterior, como referencia
+    claves = {}
+    patrones_regex = combinar_listas_regex(PRIMERAS_PALABRAS, SEGUNDAS_PALABRAS)
+    tamano_texto = len(contenido)
+
+    for patron in patrones_regex:
+        coincidencias = re.findall(patron, contenido)
+        if coincidencias:
+            coincidencias_unicas = list(set(coincidencias))
+            for coincidencia in coincidencias_unicas:
+                claves[patron] = contenido.rfind(coincidencia)/tamano_texto
+
+    return claves
+
+
+def texto_sentencia(rnd, num_paginas):
+    formulas = [formula for formula, peso in DECISIONES for _ in range(peso)]
+    paginas = paginas_sentencia(
+        rnd, rnd.choice(ORGANOS), f"{rnd.randint(100, 99999)}-2023", rnd.choice(MATERIAS),
+        rnd.choice(formulas), num_paginas
+    )
+    return "\n".join(linea for pagina in paginas for linea in pagina)
+
+
+def texto_aleatorio(rnd):
+    # muchas formulas de decision con separadores variados entre palabras de
+    # relleno: fuerza patrones repetidos con distinto espacio en blanco
+    partes = []
+    for _ in range(rnd.randint(20, 200)):
+        if rnd.random() < 0.15:
+            partes.append(rnd.choice(PRIMERAS_PALABRAS) + rnd.choice(SEPARADORES) + rnd.choice(SEGUNDAS_PALABRAS))
+        else:
+            partes.append(rnd.choice(PALABRAS + PRIMERAS_PALABRAS + SEGUNDAS_PALABRAS))
+    return rnd.choice([" ", "\n"]).join(partes)
+
+
+def generar_textos(num_documentos, semilla):
+    rnd = random.Random(semilla)
+    textos = []
+    for i in range(num_documentos):
+        textos.append(texto_sentencia(rnd, rnd.randint(2, 8)) if i % 2 else texto_aleatorio(rnd))
+    return textos
+
+
+def diferencia_por_variantes(contenido, patron, valor_anterior, valor_nuevo):
+    # el patron coincide con varios textos distintos: la version anterior
+    # devolvia el rfind de alguno de ellos y la nueva el de la ultima coincidencia
+    variantes = set(re.findall(patron, contenido))
+    posiciones = {contenido.rfind(variante) / len(contenido) for variante in variantes}
+    return len(variantes) > 1 and valor_anterior in posiciones and valor_nuevo == max(posiciones)
+
+
+def comparar(textos):
+    identicos, por_variantes, errores = 0, 0, []
+    for numero, contenido in enumerate(textos):
+        anterior = estructura_pdf_anterior(contenido)
+        nuevo = estructura_pdf(contenido)
+        if anterior == nuevo and list(anterior) == list(nuevo):
+            identicos += 1
+            continue
+        if list(anterior) == list(nuevo) and all(
+            anterior[patron] == nuevo[patron] or diferencia_por_variantes(contenido, patron, anterior[patron], nuevo[patron])
+            for patron in anterior
+        ):
+            por_variantes += 1
+            continue
+        errores.append(numero)
+    return identicos, por_variantes, errores
+
+
+def medir(textos, repeticiones):
+    resultados = []
+    for nombre, funcion in (("anterior", estructura_pdf_anterior), ("escaner", estructura_pdf)):
+        segundos = min(timeit.repeat(lambda: [funcion(t) for t in textos], number=1, repeat=repeticiones))
+        resultados.append((nombre, segundos / len(textos)))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Equivalencia y tiempos de estructura_pdf")
+    parser.add_argument("--documentos", type=int, default=3000)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--paginas-largo", type=int, default=60, help="paginas del documento largo para medir")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    textos = generar_textos(args.documentos, args.semilla)
+    identicos, por_variantes, errores = comparar(textos)
+    print(f"{len(textos)} documentos: {identicos} identicos, {por_variantes} difieren solo por variantes de un mismo patron, {len(errores)} errores")
+
+    largo = texto_sentencia(random.Random(args.semilla), args.paginas_largo)
+    for titulo, muestra in ((f"documento de {len(largo)} caracteres", [largo]), (f"{min(200, len(textos))} documentos del corpus", textos[:200])):
+        (_, anterior), (_, escaner) = medir(muestra, args.repeticiones)
+        print(f"{titulo}: anterior {1000 * anterior:.2f} ms/doc, escaner {1000 * escaner:.2f} ms/doc ({anterior / escaner:.0f}x)")
+
+    if errores:
+        print("Documentos con diferencias no explicadas:", errores[:20])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
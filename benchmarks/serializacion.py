@@ -0,0 +1,121 @@
+# Mide la serializacion de una respuesta grande de /search (10k filas por
+# defecto) con la ruta anterior (dict por fila + jsonable_encoder +
+# JSONResponse, lo que hacia FastAPI con el dict devuelto) y la actual
+# (dict(zip) + ORJSONResponse), y cuantos bytes viajan sin comprimir, con gzip
+# (nivel del GZipMiddleware del backend) y con brotli (calidad del
+# BrotliMiddleware, si esta instalado el paquete brotli).
+#
+#   python benchmarks/serializacion.py --filas 10000
+#   python benchmarks/serializacion.py --filas 10000 --texto
+
+import argparse
+import gzip
+import os
+import random
+import sys
+import timeit
+import warnings
+from datetime import date, timedelta
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, DIRECTORIO)
+
+from corpus import PALABRAS  # noqa: E402
+
+# mismos valores que backend/app.py
+CLAVES_BUSQUEDA = ("ndetalle", "url", "clasificacion")
+CLAVES_BUSQUEDA_TEXTO = CLAVES_BUSQUEDA + ("rank", "fragmento")
+GZIP_NIVEL = 5
+BROTLI_CALIDAD = 4
+
+
+def generar_filas(num_filas, texto, semilla):
+    # filas como las devuelve la consulta de /search: total_count,
+    # fecha_resolucion y despues las columnas de la respuesta
+    rnd = random.Random(semilla)
+    filas = []
+    for i in range(num_filas):
+        ndetalle = str(2000000 + i)
+        fila = (
+            num_filas, date(2024, 6, 30) - timedelta(days=i // 20), ndetalle,
+            f"descargas_pdf/CAS-{rnd.randint(100, 99999)}-2023,id={ndetalle}.pdf",
+            rnd.choice(["fundado", "infundado", "improcedente", None]),
+        )
+        if texto:
+            fragmento = " ... ".join(
+                " ".join(rnd.choice(PALABRAS) for _ in range(15)).replace(" ", " <b>despido</b> ", 1)
+                for _ in range(2)
+            )
+            fila += (rnd.random(), fragmento)
+        filas.append(fila)
+    return filas
+
+
+def respuesta_anterior(filas, texto):
+    items = [
+        {"ndetalle": row[2], "url": row[3], "clasificacion": row[4]}
+        for row in filas
+    ]
+    if texto:
+        for item, row in zip(items, filas):
+            item["rank"] = row[5]
+            item["fragmento"] = row[6]
+    contenido = {"total_count": filas[0][0], "items": items, "next_cursor": None}
+    return JSONResponse(jsonable_encoder(contenido)).body
+
+
+def respuesta_actual(filas, texto):
+    claves = CLAVES_BUSQUEDA_TEXTO if texto else CLAVES_BUSQUEDA
+    items = [dict(zip(claves, row[2:])) for row in filas]
+    return ORJSONResponse({"total_count": filas[0][0], "items": items, "next_cursor": None}).body
+
+
+def compresores():
+    resultado = [("gzip", lambda cuerpo: gzip.compress(cuerpo, compresslevel=GZIP_NIVEL))]
+    try:
+        import brotli
+    except ImportError:
+        print("brotli no esta instalado: se omite (pip install brotli)")
+    else:
+        resultado.append(("brotli", lambda cuerpo: brotli.compress(cuerpo, quality=BROTLI_CALIDAD)))
+    return resultado
+
+
+def medir(funcion, repeticiones):
+    return min(timeit.repeat(funcion, number=1, repeat=repeticiones))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo y tamano de la serializacion de /search")
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--texto", action="store_true", help="respuesta de busqueda por texto (rank y fragmento)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--repeticiones", type=int, default=10)
+    args = parser.parse_args()
+    # las versiones recientes de FastAPI marcan ORJSONResponse como obsoleta;
+    # el backend la sigue usando
+    warnings.filterwarnings("ignore", message="ORJSONResponse is deprecated")
+
+    filas = generar_filas(args.filas, args.texto, args.semilla)
+    cuerpos = {}
+    for nombre, funcion in (("anterior", respuesta_anterior), ("actual", respuesta_actual)):
+        cuerpos[nombre] = funcion(filas, args.texto)
+        segundos = medir(lambda: funcion(filas, args.texto), args.repeticiones)
+        print(f"{nombre}: {1000 * segundos:.1f} ms, {len(cuerpos[nombre]) / 1024:.0f} KB sin comprimir")
+
+    if orjson.loads(cuerpos["anterior"]) != orjson.loads(cuerpos["actual"]):
+        sys.exit("Las dos rutas devuelven contenidos distintos")
+
+    for nombre, comprimir in compresores():
+        for ruta, cuerpo in cuerpos.items():
+            comprimido = comprimir(cuerpo)
+            segundos = medir(lambda: comprimir(cuerpo), args.repeticiones)
+            print(f"{nombre} {ruta}: {len(comprimido) / 1024:.0f} KB ({100 * len(comprimido) / len(cuerpo):.1f}%), {1000 * segundos:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
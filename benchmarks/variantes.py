@@ -0,0 +1,93 @@
+# Mide los endpoints del backend con distintas configuraciones del pool de
+# conexiones y del ejecutor de tareas bloqueantes, sobre la misma carga:
+#
+#   pool:     DB-POOL-PING-SEGUNDOS=0 (ping en cada prestamo, como el check
+#             por defecto) contra el ping solo de conexiones ociosas, y
+#             DB-POOL-MAX=1 contra el tamano por defecto
+#   ejecutor: EJECUTOR-HILOS=1 (tareas de Chroma, GCS y el modelo en serie)
+#             contra el valor por defecto
+#
+# La carga se hace una vez con ejecutar.py --solo carga; cada variante corre
+# ejecutar.py --solo backend en un proceso propio, porque el backend lee su
+# configuracion al importarse. Usa la misma base desechable que ejecutar.py.
+#
+#   python benchmarks/variantes.py --sentencias 200
+#   python benchmarks/variantes.py --grupos ejecutor --sin-carga --directorio /tmp/bench
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+EJECUTAR = os.path.join(DIRECTORIO, "ejecutar.py")
+
+# grupo -> (endpoints que mide, [(nombre, variables de entorno)])
+VARIANTES = {
+    "pool": (["filters", "search", "statistics"], [
+        ("ping en cada prestamo", {"DB-POOL-PING-SEGUNDOS": "0"}),
+        ("ping de ociosas", {}),
+        ("DB-POOL-MAX=1", {"DB-POOL-MAX": "1"}),
+    ]),
+    "ejecutor": (["descargar_lote", "similar", "semantic_search"], [
+        ("EJECUTOR-HILOS=1", {"EJECUTOR-HILOS": "1"}),
+        ("EJECUTOR-HILOS por defecto", {}),
+    ]),
+}
+
+
+def ejecutar(args, solo, extra=(), entorno=None):
+    comando = [
+        sys.executable, EJECUTAR, "--solo", solo, "--directorio", args.directorio,
+        "--sentencias", str(args.sentencias), "--semilla", str(args.semilla),
+        "--peticiones", str(args.peticiones), "--concurrencia", str(args.concurrencia),
+    ]
+    if args.permitir_db:
+        comando.append("--permitir-db")
+    subprocess.run(comando + list(extra), env={**os.environ, **(entorno or {})}, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend con distintas configuraciones de pool y ejecutor")
+    parser.add_argument("--grupos", nargs="*", choices=list(VARIANTES), default=list(VARIANTES))
+    parser.add_argument("--sentencias", type=int, default=200)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--peticiones", type=int, default=200, help="peticiones por endpoint")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--directorio", help="carpeta de trabajo (por defecto una temporal)")
+    parser.add_argument("--sin-carga", action="store_true", help="reusar la carga ya hecha en --directorio")
+    parser.add_argument("--salida", help="guardar los resultados en este json")
+    parser.add_argument("--permitir-db", action="store_true", help="permitir una base sin 'bench' en el nombre")
+    args = parser.parse_args()
+
+    args.directorio = os.path.abspath(args.directorio or tempfile.mkdtemp(prefix="bench_variantes_"))
+    if not args.sin_carga:
+        ejecutar(args, "carga")
+
+    resultados = {}
+    for grupo in args.grupos:
+        endpoints, variantes = VARIANTES[grupo]
+        for nombre, entorno in variantes:
+            salida = os.path.join(args.directorio, f"variante_{grupo}_{len(resultados)}.json")
+            print(f"\n== {grupo}: {nombre}")
+            ejecutar(args, "backend", ["--endpoints", *endpoints, "--salida", salida], entorno)
+            with open(salida, encoding="utf-8") as f:
+                resultados.setdefault(grupo, {})[nombre] = json.load(f)["endpoints"]
+
+    for grupo, por_variante in resultados.items():
+        print(f"\nResumen {grupo} (req/s, p99 ms)")
+        for nombre, endpoints in por_variante.items():
+            medidas = ", ".join(
+                f"{endpoint} {r['por_segundo']:.1f} / {1000 * r['p99']:.1f}" for endpoint, r in endpoints.items()
+            )
+            print(f"  {nombre}: {medidas}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
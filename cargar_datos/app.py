@@ -2,21 +2,26 @@ from sentence_transformers import SentenceTransformer
 from google.oauth2 import service_account
 from chromadb import PersistentClient
 from clasificacion import extraer_texto_pdf
-from clasificacion import clasificar_archivo_pdf
+from clasificacion import clasificar_pdf_bytes
+from clasificacion import parte_resolutiva
+from cache_pdf import crear_cache_pdf
+from metricas import medir, observar, contar, resumen_metricas, exportar_metricas
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from google.oauth2 import service_account
 from google.cloud import storage
 import json
+import ijson
 import re
 import logging
 import time
 import pdfplumber
-import numpy as np
 import os
 import psycopg2
-from statistics import mode
+from psycopg2.extras import execute_values
 import io
-import subprocess
+from itertools import islice
+import requests
 
 load_dotenv()
 
@@ -48,10 +53,23 @@ def get_db_connection():
         options='-c statement_timeout=10000'  # 10 segundos
     )
 
-ruta_credenciales = os.path.join(os.path.dirname(__file__), 'credenciales.json')
-credentials = service_account.Credentials.from_service_account_file(ruta_credenciales)
-storage_client = storage.Client(credentials=credentials)
-bucket = storage_client.bucket("automatizacion-casillero")
+# con BUCKET-LOCAL se lee una carpeta local en vez del bucket (benchmarks/)
+if os.getenv("BUCKET-LOCAL"):
+    from bucket_local import BucketLocal
+    bucket = BucketLocal(os.getenv("BUCKET-LOCAL"))
+else:
+    ruta_credenciales = os.path.join(os.path.dirname(__file__), 'credenciales.json')
+    credentials = service_account.Credentials.from_service_account_file(ruta_credenciales)
+    storage_client = storage.Client(credentials=credentials)
+    bucket = storage_client.bucket("automatizacion-casillero")
+cache_pdf = crear_cache_pdf()
+
+# descargas del bucket: timeout por intento, reintentos, descargas simultaneas y
+# maximo de pdfs descargados esperando a ser procesados
+TIMEOUT_DESCARGA = float(os.getenv("DESCARGA-TIMEOUT", "15"))
+REINTENTOS_DESCARGA = int(os.getenv("DESCARGA-REINTENTOS", "3"))
+DESCARGAS_CONCURRENTES = int(os.getenv("DESCARGAS-CONCURRENTES", "8"))
+COLA_DESCARGAS = int(os.getenv("COLA-DESCARGAS", "32"))
 
 # -----------------------------------------------------
 
@@ -61,10 +79,11 @@ bucket = storage_client.bucket("automatizacion-casillero")
 
 def obtener_fecha_mas_reciente(prefijo_folder):
     try:
-        blobs = bucket.list_blobs(prefix=prefijo_folder)
+        with medir("listado_blobs"):
+            blobs = bucket.list_blobs(prefix=prefijo_folder)
 
-        # Filtramos y obtenemos la fecha de actualización más reciente
-        fechas = [(blob.name, blob.updated) for blob in blobs if not blob.name.endswith('/')]
+            # Filtramos y obtenemos la fecha de actualización más reciente
+            fechas = [(blob.name, blob.updated) for blob in blobs if not blob.name.endswith('/')]
         if not fechas:
             logger.info(f"No se encontraron archivos en el folder: {prefijo_folder}")
             return None
@@ -94,6 +113,14 @@ def eliminar_diccionarios_repetidos(lista):
             resultado.append(dic)
     return resultado
 
+def iterar_por_lotes(iterable, tamano_lote):
+    iterador = iter(iterable)
+    while True:
+        lote = list(islice(iterador, tamano_lote))
+        if not lote:
+            return
+        yield lote
+
 def leer_json(nombre_remoto_json):
     try:
         blob = bucket.blob(nombre_remoto_json)
@@ -104,14 +131,53 @@ def leer_json(nombre_remoto_json):
         logger.info(f"No se pudo leer el JSON desde el bucket: {e}")
         raise
 
-def leer_paginas_pdf_como_lineas(pdf_key , num_paginas=1):
-    blob = bucket.blob(pdf_key)
-    buffer = io.BytesIO()
-    blob.download_to_file(buffer)
-    buffer.seek(0)
+def descargar_pdf(url):
+    with medir("descarga"):
+        pdf_bytes = descargar_con_reintentos(url)
+    contar("descarga")
+    return pdf_bytes
 
+def descargar_con_reintentos(url):
+    for intento in range(REINTENTOS_DESCARGA + 1):
+        try:
+            return cache_pdf.leer(bucket, url, timeout=TIMEOUT_DESCARGA)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            if intento == REINTENTOS_DESCARGA:
+                raise
+            espera = 0.5 * 2 ** intento
+            logger.info(f"Reintentando {url} en {espera:.1f}s: {e}")
+            time.sleep(espera)
+
+def descargar_en_paralelo(pares, num_descargas=None, tamano_cola=None):
+    # recibe (clave, url) y devuelve (clave, pdf_bytes, error) a medida que
+    # terminan las descargas; nunca hay mas de tamano_cola pdfs descargados o
+    # en curso, asi la red no se adelanta demasiado al procesamiento
+    num_descargas = num_descargas or DESCARGAS_CONCURRENTES
+    tamano_cola = max(tamano_cola or COLA_DESCARGAS, num_descargas)
+    pares = iter(pares)
+    pendientes = {}
+
+    with ThreadPoolExecutor(max_workers=num_descargas) as executor:
+        def encolar():
+            for clave, url in islice(pares, tamano_cola - len(pendientes)):
+                pendientes[executor.submit(descargar_pdf, url)] = clave
+
+        encolar()
+        while pendientes:
+            terminados, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                clave = pendientes.pop(futuro)
+                try:
+                    yield clave, futuro.result(), None
+                except Exception as e:
+                    yield clave, None, e
+            encolar()
+
+def lineas_de_pdf(pdf_bytes, num_paginas=1):
     resultado = []
-    with pdfplumber.open(buffer) as pdf:
+    with medir("extraccion_pdf"), pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
         total_paginas = len(pdf.pages)
         for i in range(min(num_paginas, total_paginas)):
             texto = pdf.pages[i].extract_text()
@@ -120,6 +186,9 @@ def leer_paginas_pdf_como_lineas(pdf_key , num_paginas=1):
 
     return resultado if resultado else None
 
+def leer_paginas_pdf_como_lineas(pdf_key , num_paginas=1): # obtener las lineas de la primera pagina
+    return lineas_de_pdf(descargar_pdf(pdf_key), num_paginas)
+
 
 # -----------------------------------------------------
 
@@ -144,91 +213,141 @@ def filtrar_precargado_json():
     json_filtrado = [item for item in json_ids_procesados if str(item.get("ndetalle")) not in pdfs_ya_subidos]
     return json_filtrado
 
-def cargar_json_a_database(data_filtrada):
+def iterar_json_filtrado(tamano_lote=5000):
+
+    # igual que filtrar_precargado_json, pero leyendo el json del bucket de
+    # forma incremental y consultando a la base de datos solo los ndetalles
+    # de cada lote, para que la memoria no crezca con el archivo ni la tabla
+    archivo, _ = obtener_fecha_mas_reciente('data')
+    blob = bucket.blob(archivo)
 
-    # creamos una conexion
     conn = get_db_connection()
     cur = conn.cursor()
-
-    # comenzamos a insetar los campos del json en la base de datos
-    for i,item in enumerate(data_filtrada):
-        logger.info(f"[INFO] Procesadas {i}/{len(data_filtrada)} sentencias -> {i}")
-
-        # Insertar en sentencias_y_autos
-        cur.execute("""
-            INSERT INTO sentencias_y_autos (
-                ndetalle, acto_procesal, anio_expe, anio_recurso_expe,
-                anio_resolucion, codigo_distrito, codigo_organo, codigo_recurso,
-                desc_documento, desc_tipo_recurso_expe, distrito_judicial_expe,
-                especialidad_expe, fecha_ingreso_expe, fecha_resolucion,
-                instancia_detalle, instancia_expe, juez_firma_resolucion,
-                mostrar_botones, nexpedeinte, norma_derecho_interno_expe,
-                numero_en_letras, numero_recurso_expe, numero_resolucion,
-                organo_detalle, organo_expe, proceso_exp, sede_detalle,
-                sumilla, tipo_documento, xformato_expe, url, clasificacion,
-                subclasificacion, fecha_real
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s)
-            ON CONFLICT (ndetalle) DO NOTHING;
-        """, (
-            item.get("ndetalle"),
-            item.get("actoProcesal"),
-            item.get("anioExpe"),
-            item.get("anioRecursoExpe"),
-            item.get("anioResolucion"),
-            item.get("codigoDistrito"),
-            item.get("codigoOrgano"),
-            item.get("codigoRecurso"),
-            item.get("descDocumento"),
-            item.get("descTipoRecursoExpe"),
-            item.get("distritoJudicialExpe"),
-            item.get("especialidadExpe"),
-            item.get("fechaIngresoExpe"),
-            item.get("fechaResolucion"),
-            item.get("instanciaDetalle"),
-            item.get("instanciaExpe"),
-            item.get("juezFirmaResolucion"),
-            item.get("mostrarBotones"),
-            item.get("nexpediente"),
-            item.get("normaDerechoInternoExpe"),
-            item.get("numeroEnLetras"),
-            item.get("numeroRecursoExpe"),
-            item.get("numeroResolucion"),
-            item.get("organoDetalle"),
-            item.get("organoExpe"),
-            item.get("procesoExp"),
-            item.get("sedeDetalle"),
-            item.get("sumilla"),
-            item.get("tipoDocumento"),
-            item.get("xformatoExpe"),
-            item.get("url"),
-            item.get("clasificacion"),
-            item.get("subclasificacion"),
-            item.get("fecha_real")
-        ))
-
-        # Insertar jueces y la relación
-        for juez in item.get("magistrados", []):
-            codigo = juez.get("codigo")
-            nombre = juez.get("valor")
-            if codigo and nombre:
-                # Insertar juez
-                cur.execute("""
+    try:
+        with blob.open("rb") as f:
+            items = ijson.items(f, "item.lista.item", use_float=True)
+            lotes = iterar_por_lotes(items, tamano_lote)
+            while True:
+                with medir("json_lectura"):
+                    lote = next(lotes, None)
+                if lote is None:
+                    break
+                contar("json_lectura", len(lote))
+                lote = eliminar_diccionarios_repetidos(lote)
+                ndetalles = list({str(item.get("ndetalle")) for item in lote})
+                with medir("db_consulta"):
+                    cur.execute(
+                        "SELECT ndetalle FROM sentencias_y_autos WHERE ndetalle = ANY(%s);",
+                        (ndetalles,)
+                    )
+                    ya_subidos = {row[0] for row in cur.fetchall()}
+                yield [item for item in lote if str(item.get("ndetalle")) not in ya_subidos]
+    finally:
+        cur.close()
+        conn.close()
+
+# columna en sentencias_y_autos -> clave en el json
+CAMPOS_SENTENCIA = [
+    ("ndetalle", "ndetalle"),
+    ("acto_procesal", "actoProcesal"),
+    ("anio_expe", "anioExpe"),
+    ("anio_recurso_expe", "anioRecursoExpe"),
+    ("anio_resolucion", "anioResolucion"),
+    ("codigo_distrito", "codigoDistrito"),
+    ("codigo_organo", "codigoOrgano"),
+    ("codigo_recurso", "codigoRecurso"),
+    ("desc_documento", "descDocumento"),
+    ("desc_tipo_recurso_expe", "descTipoRecursoExpe"),
+    ("distrito_judicial_expe", "distritoJudicialExpe"),
+    ("especialidad_expe", "especialidadExpe"),
+    ("fecha_ingreso_expe", "fechaIngresoExpe"),
+    ("fecha_resolucion", "fechaResolucion"),
+    ("instancia_detalle", "instanciaDetalle"),
+    ("instancia_expe", "instanciaExpe"),
+    ("juez_firma_resolucion", "juezFirmaResolucion"),
+    ("mostrar_botones", "mostrarBotones"),
+    ("nexpedeinte", "nexpediente"),
+    ("norma_derecho_interno_expe", "normaDerechoInternoExpe"),
+    ("numero_en_letras", "numeroEnLetras"),
+    ("numero_recurso_expe", "numeroRecursoExpe"),
+    ("numero_resolucion", "numeroResolucion"),
+    ("organo_detalle", "organoDetalle"),
+    ("organo_expe", "organoExpe"),
+    ("proceso_exp", "procesoExp"),
+    ("sede_detalle", "sedeDetalle"),
+    ("sumilla", "sumilla"),
+    ("tipo_documento", "tipoDocumento"),
+    ("xformato_expe", "xformatoExpe"),
+    ("url", "url"),
+    ("clasificacion", "clasificacion"),
+    ("subclasificacion", "subclasificacion"),
+    ("fecha_real", "fecha_real"),
+]
+COLUMNAS_SENTENCIA = ", ".join(columna for columna, _ in CAMPOS_SENTENCIA)
+
+def fila_sentencia(item):
+    return tuple(item.get(clave) for _, clave in CAMPOS_SENTENCIA)
+
+def jueces_de_sentencia(item):
+    for juez in item.get("magistrados", []):
+        codigo = juez.get("codigo")
+        nombre = juez.get("valor")
+        if codigo and nombre:
+            yield codigo, nombre
+
+def cargar_json_a_database_por_lotes(data_filtrada, tamano_lote=1000):
+
+    # cada tabla se envia en un INSERT multi-fila por lote, con un commit por
+    # lote (benchmarks/carga_lotes.py lo compara con la carga fila por fila)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    crear_tabla_pendientes(cur)
+    conn.commit()
+    inicio = time.perf_counter()
+
+    for i in range(0, len(data_filtrada), tamano_lote):
+        lote = data_filtrada[i:i + tamano_lote]
+
+        filas_sentencias = [fila_sentencia(item) for item in lote]
+
+        # el primer nombre visto para cada codigo es el que se inserta
+        filas_jueces = {}
+        filas_relaciones = {}
+        for item in lote:
+            for codigo, nombre in jueces_de_sentencia(item):
+                filas_jueces.setdefault(codigo, (codigo, nombre))
+                filas_relaciones.setdefault((item["ndetalle"], codigo), (item["ndetalle"], codigo))
+
+        with medir("db_insercion"):
+            execute_values(cur, f"""
+                INSERT INTO sentencias_y_autos ({COLUMNAS_SENTENCIA})
+                VALUES %s
+                ON CONFLICT (ndetalle) DO NOTHING;
+            """, filas_sentencias, page_size=tamano_lote)
+
+            if filas_jueces:
+                execute_values(cur, """
                     INSERT INTO jueces (codigo, nombre_juez)
-                    VALUES (%s, %s)
+                    VALUES %s
                     ON CONFLICT (codigo) DO NOTHING;
-                """, (codigo, nombre))
+                """, list(filas_jueces.values()), page_size=tamano_lote)
 
-                # Insertar relación sentencia-juez
-                cur.execute("""
+            if filas_relaciones:
+                execute_values(cur, """
                     INSERT INTO sentencias_jueces (ndetalle, codigo)
-                    VALUES (%s, %s)
+                    VALUES %s
                     ON CONFLICT DO NOTHING;
-                """, (item["ndetalle"], codigo))
+                """, list(filas_relaciones.values()), page_size=tamano_lote)
 
-        if i % 20 == 0:
+            marcar_pendientes(cur, [item["ndetalle"] for item in lote])
             conn.commit()
+        contar("db_insercion", len(lote))
+        logger.info(f"[INFO] Procesadas {i + len(lote)}/{len(data_filtrada)} sentencias")
+
+    cur.close()
+    conn.close()
+    duracion = time.perf_counter() - inicio
+    logger.info(f"{len(data_filtrada)} sentencias cargadas en {duracion:.1f}s ({len(data_filtrada)/max(duracion, 1e-9):.0f} filas/s)")
 
 # ---------------------------------------------------------------------
 
@@ -237,29 +356,17 @@ def cargar_json_a_database(data_filtrada):
 # -------------------------------------------------------------------------------------
 
 
-def leer_paginas_pdf_como_lineas(pdf_key , num_paginas=1): # obtener las lineas de la primera pagina
-    blob = bucket.blob(pdf_key)
-    buffer = io.BytesIO()
-    blob.download_to_file(buffer)
-    buffer.seek(0)
-
-    resultado = []
-    with pdfplumber.open(buffer) as pdf:
-        total_paginas = len(pdf.pages)
-        for i in range(min(num_paginas, total_paginas)):
-            texto = pdf.pages[i].extract_text()
-            lineas = texto.splitlines() if texto else []
-            resultado.append(lineas)
-
-    return resultado if resultado else None
-
-def enrutar_pdfs():
+def enrutar_pdfs(tamano_lote=1000, filas_por_segundo=None):
 
     # Conexion a la base de datos y extraccion de los archivos pdfs
     conn = get_db_connection()
     cur = conn.cursor()
+    crear_tabla_pendientes(cur)
+    conn.commit()
     prefix = "descargas_pdf/"
-    blobs = list(bucket.list_blobs(prefix=prefix))  # Convertir a lista para contar
+    with medir("listado_blobs"):
+        blobs = list(bucket.list_blobs(prefix=prefix))  # Convertir a lista para contar
+    contar("listado_blobs", len(blobs))
 
     # Regex para extraer el ID del nombre del archivo
     pattern = r"id=(\d+)\.pdf$"
@@ -284,33 +391,188 @@ def enrutar_pdfs():
     # Filtramos solo los ndetalles que se encuentran en ambos
     ndetalles_a_subir = list(ndetalles_faltantes & set(ndetalles_bucket.keys()))
 
-    # Para cada ndetalle a subir
-    for i,ndet in enumerate(ndetalles_a_subir):
-        time.sleep(0.1)
-        filename = ndetalles_bucket[ndet] # obtenemos el nombre en el bucket
-        logger.info(f"-> {filename} : {i} / {len(ndetalles_a_subir)}")
-        # actualizamos
-        cur.execute(
-            "UPDATE sentencias_y_autos SET url = %s WHERE ndetalle = %s",
-            (filename, ndet)
-        )
-        conn.commit()
-        logger.info("Comiteado ----")
+    # Actualizamos por lotes con un solo UPDATE ... FROM (VALUES ...) por lote
+    pares = [(ndet, ndetalles_bucket[ndet]) for ndet in ndetalles_a_subir]
+    inicio = time.perf_counter()
+    for i in range(0, len(pares), tamano_lote):
+        lote = pares[i:i + tamano_lote]
+        with medir("db_actualizacion"):
+            execute_values(cur, """
+                UPDATE sentencias_y_autos AS s
+                SET url = v.url
+                FROM (VALUES %s) AS v(ndetalle, url)
+                WHERE s.ndetalle = v.ndetalle
+            """, lote, page_size=tamano_lote)
+            marcar_pendientes(cur, [ndetalle for ndetalle, _ in lote])
+            conn.commit()
+        contar("db_actualizacion", len(lote))
 
-        # cada 40 realizamos un commit y mostramos el progreso
-        if i % 40 == 0:
-            time.sleep(1)
-            logger.info(f"Progreso: {i}/{len(ndetalles_a_subir)}")
+        enviados = i + len(lote)
+        logger.info(f"Progreso: {enviados}/{len(pares)}")
+
+        # si se limita la velocidad, esperamos solo lo necesario para no
+        # superar filas_por_segundo
+        if filas_por_segundo:
+            adelanto = enviados / filas_por_segundo - (time.perf_counter() - inicio)
+            if adelanto > 0:
+                time.sleep(adelanto)
 
-    # Guardar cambios finales
-    conn.commit()
     cur.close()
     conn.close()
+    return ndetalles_a_subir
+
+def clasificar_en_serie(filas, desde_el_final=False, texto_completo=False):
+    # las descargas siguen en segundo plano mientras se clasifica
+    for ndetalle, pdf_bytes, error in descargar_en_paralelo(filas):
+        if error:
+            logger.error(f"Error procesando {ndetalle}: {error}")
+            continue
+        try:
+            logger.info(f"Procesando {ndetalle}...")
+            yield ndetalle, clasificar_pdf_bytes(pdf_bytes, ndetalle, desde_el_final=desde_el_final, texto_completo=texto_completo)
+
+        except Exception as e:
+            logger.error(f"Error procesando {ndetalle}: {e}")
+
+def recoger_clasificaciones(terminados, pendientes):
+    for futuro in terminados:
+        ndetalle = pendientes.pop(futuro)
+        try:
+            yield ndetalle, futuro.result()
+        except Exception as e:
+            logger.error(f"Error procesando {ndetalle}: {e}")
+
+def clasificar_en_paralelo(filas, num_procesos, desde_el_final=False, texto_completo=False):
+    # las descargas corren en hilos de este proceso mientras los workers
+    # extraen el texto y clasifican; se limita el numero de pdfs en memoria
+    max_pendientes = num_procesos * 2
+    pendientes = {}
+    with ProcessPoolExecutor(max_workers=num_procesos) as executor:
+        for ndetalle, pdf_bytes, error in descargar_en_paralelo(filas):
+            if error:
+                logger.error(f"Error procesando {ndetalle}: {error}")
+                continue
+            logger.info(f"Procesando {ndetalle}...")
 
-def clasificar_archivos():
+            futuro = executor.submit(clasificar_pdf_bytes, pdf_bytes, ndetalle, desde_el_final, texto_completo)
+            pendientes[futuro] = ndetalle
+
+            if len(pendientes) >= max_pendientes:
+                terminados, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                yield from recoger_clasificaciones(terminados, pendientes)
+
+        yield from recoger_clasificaciones(list(pendientes), pendientes)
+
+def crear_tabla_textos(cur):
+    # texto completo de cada sentencia para la busqueda por palabras del
+    # backend; el tsvector se calcula solo y se indexa con GIN
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS textos_sentencias (
+            ndetalle TEXT PRIMARY KEY,
+            texto TEXT NOT NULL,
+            documento tsvector GENERATED ALWAYS AS (to_tsvector('spanish', texto)) STORED
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS textos_sentencias_documento_idx ON textos_sentencias USING GIN (documento);")
+
+def insertar_textos(cur, filas):
+    # dentro de un savepoint: si Postgres rechaza un texto (por ejemplo un
+    # tsvector demasiado grande) se deshace solo este insert y la transaccion
+    # de quien llama, con sus UPDATE de clasificacion, sigue valida
+    cur.execute("SAVEPOINT guardar_textos;")
+    try:
+        with medir("db_insercion_textos"):
+            execute_values(cur, """
+                INSERT INTO textos_sentencias (ndetalle, texto)
+                VALUES %s
+                ON CONFLICT (ndetalle) DO UPDATE SET texto = EXCLUDED.texto;
+            """, filas)
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT guardar_textos;")
+        raise
+    cur.execute("RELEASE SAVEPOINT guardar_textos;")
+    contar("db_insercion_textos", len(filas))
 
+def guardar_textos(cur, textos):
+    if not textos:
+        return
+    filas = [(ndetalle, texto.replace("\x00", "")) for ndetalle, texto in textos]
+    textos.clear()
+    try:
+        insertar_textos(cur, filas)
+    except psycopg2.Error as e:
+        # se reintenta uno por uno para perder solo los textos que fallan
+        logger.error(f"Error guardando {len(filas)} textos, reintentando uno por uno: {e}")
+        for fila in filas:
+            try:
+                insertar_textos(cur, [fila])
+            except psycopg2.Error as e:
+                logger.error(f"Error guardando el texto de {fila[0]}: {e}")
+
+def indexar_textos_faltantes(tamano_lote=40):
+    # extrae el texto de los pdfs enrutados que aun no estan en
+    # textos_sentencias (los anteriores a la busqueda por texto, o los
+    # clasificados con INDEXAR-TEXTOS=0)
     conn = get_db_connection()
     cur = conn.cursor()
+    crear_tabla_textos(cur)
+    conn.commit()
+
+    cur.execute('''
+        SELECT s.ndetalle, s.url
+        FROM sentencias_y_autos s
+        WHERE
+            s.url IS NOT NULL
+            AND
+            NOT EXISTS (SELECT 1 FROM textos_sentencias t WHERE t.ndetalle = s.ndetalle)
+    ''')
+    filas = cur.fetchall()
+    logger.info(f"Pdfs sin texto indexado {len(filas)}")
+
+    textos = []
+    try:
+        for contador, (ndetalle, pdf_bytes, error) in enumerate(descargar_en_paralelo(filas), start=1):
+            if error:
+                logger.error(f"Error indexando {ndetalle}: {error}")
+                continue
+            try:
+                with medir("extraccion_pdf"):
+                    textos.append((ndetalle, extraer_texto_pdf(pdf_bytes)))
+                contar("extraccion_pdf")
+            except Exception as e:
+                logger.error(f"Error indexando {ndetalle}: {e}")
+            if len(textos) >= tamano_lote:
+                guardar_textos(cur, textos)
+                conn.commit()
+                logger.info(f"Textos indexados {contador}/{len(filas)}")
+
+        guardar_textos(cur, textos)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+def clasificar_archivos(num_procesos=None, desde_el_final=None, texto_completo=None):
+
+    # numero de procesos para extraer y clasificar (1 = en serie)
+    if num_procesos is None:
+        num_procesos = int(os.getenv("PROCESOS-CLASIFICACION", "1"))
+    # extraer paginas desde la ultima y parar al tener una decision segura
+    if desde_el_final is None:
+        desde_el_final = os.getenv("CLASIFICACION-DESDE-EL-FINAL", "0") == "1"
+    # si se indexa el texto (paso 3.1) hace falta el documento completo: se
+    # clasifica con todo el texto y se guarda desde esta misma descarga, en vez
+    # de repetirla en indexar_textos_faltantes. Desde el final solo ahorra
+    # extraccion con INDEXAR-TEXTOS=0
+    if texto_completo is None:
+        texto_completo = os.getenv("INDEXAR-TEXTOS", "1") == "1"
+    if desde_el_final and texto_completo:
+        logger.info("INDEXAR-TEXTOS activo: se extrae el documento completo y no se clasifica desde el final")
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    crear_tabla_textos(cur)
+    conn.commit()
 
     # Extraemos los ndetalles que posean valores nulos en la "clasificacion" pero
     # que si tengan un pdf asociado en la "url"
@@ -327,36 +589,47 @@ def clasificar_archivos():
 
     filas = cur.fetchall()
 
-    contador = 0
-    for ndetalle, url in filas:
-        contador += 1
+    if num_procesos > 1:
+        clasificaciones = clasificar_en_paralelo(filas, num_procesos, desde_el_final, texto_completo)
+    else:
+        clasificaciones = clasificar_en_serie(filas, desde_el_final, texto_completo)
+
+    paginas_extraidas = 0
+    paginas_totales = 0
+    textos = []
+
+    # los UPDATE se hacen siempre desde este proceso
+    for contador, (ndetalle, resultado) in enumerate(clasificaciones, start=1):
+        # tiempos medidos donde se clasifico (este proceso o un worker)
+        for etapa, segundos in resultado.pop('tiempos', {}).items():
+            observar(etapa, segundos)
+            contar(etapa)
+        clasificacion = resultado.get('clase', 'desconocido')
+        if 'paginas_totales' in resultado:
+            paginas_extraidas += resultado['paginas_extraidas']
+            paginas_totales += resultado['paginas_totales']
+            logger.info(f"{ndetalle}: {resultado['paginas_extraidas']}/{resultado['paginas_totales']} paginas extraidas")
+        # el texto solo viene cuando se pidio para indexarlo
+        if texto_completo and resultado.get('texto') is not None:
+            textos.append((ndetalle, resultado['texto']))
         try:
-            logger.info(f"Procesando {ndetalle}...")
-
-            blob = bucket.blob(url)
-            logger.info("Obteniendo pdf-bytes")
-            pdf_bytes = blob.download_as_bytes(timeout=15)  # <= AÑADE timeout
-
-            logger.info(f"Obteniendo texto")
-            texto = extraer_texto_pdf(pdf_bytes)
-
-            
-            logger.info(f"Empeando la clasificacion")
-            resultado = clasificar_archivo_pdf(texto, ndetalle)
-            clasificacion = resultado.get('clase', 'desconocido')
-
             cur.execute(
                 "UPDATE sentencias_y_autos SET clasificacion = %s WHERE ndetalle = %s",
                 (clasificacion, ndetalle)
             )
             if contador%40==0:
                 logger.info(" Commit !! ")
+                guardar_textos(cur, textos)
                 conn.commit()
             logger.info(f"{ndetalle} clasificado como {clasificacion} : {contador} / {len(filas)}")
 
         except Exception as e:
             logger.error(f"Error procesando {ndetalle}: {e}")
 
+    if paginas_totales:
+        logger.info(f"Paginas extraidas {paginas_extraidas}/{paginas_totales} ({100 * paginas_extraidas / paginas_totales:.1f}%)")
+
+    guardar_textos(cur, textos)
     conn.commit()
     cur.close()
     conn.close()
@@ -365,8 +638,10 @@ def clasificar_archivos():
 # --------------------------------- Clasificar por materias -------------------------------
 # ----------------------------------------------------------------------------------------
 
-client = PersistentClient(path="/home/luisazanavega/chroma_db/chroma_db")
+client = PersistentClient(path=os.getenv("CHROMA-PATH", "/home/luisazanavega/chroma_db/chroma_db"))
 collection = client.get_or_create_collection("materias_final_prueba")
+# sumilla + parte resolutiva de cada sentencia, para las busquedas semanticas del backend
+coleccion_semantica = client.get_or_create_collection("sentencias_semanticas", metadata={"hnsw:space": "cosine"})
 model = SentenceTransformer("all-MiniLM-L6-v2")
 
 
@@ -374,7 +649,20 @@ def get_embedding(text): # obtener embeddings al partir del modelo definido
     return model.encode(text, convert_to_tensor=True)
 
 
-def clasificar_por_materias():
+def ndetalles_en_chroma(ndetalles, tamano_lote=5000, coleccion=None, parte='materia'):
+    # busca por id solo los ndetalles candidatos, sin documentos ni metadatos,
+    # en vez de leer toda la coleccion
+    coleccion = coleccion if coleccion is not None else collection
+    exp = re.compile(rf"id_(\d+)_{parte}")
+    encontrados = set()
+    for lote in iterar_por_lotes(ndetalles, tamano_lote):
+        with medir("chroma_consulta"):
+            resultado = coleccion.get(ids=['id_'+ndetalle+'_'+parte for ndetalle in lote], include=[])
+        encontrados.update(exp.match(x).group(1) for x in resultado['ids'] if exp.match(x))
+    return encontrados
+
+
+def clasificar_por_materias(tamano_lote_embeddings=64, tamano_lote_consultas=256):
     conn = get_db_connection()
     cur = conn.cursor()
 
@@ -397,91 +685,291 @@ def clasificar_por_materias():
     ids_bd = {x[0]:x[1] for x in total}
     logger.info(f"Ids en la base de datos PostgreSQL {len(ids_bd)}")
 
-    # tomamos los ids de la base de datos en ChromaDB
-    data_collection = collection.get()
-    exp = re.compile(r"id_(\d+)_materia")
-    ids_chroma = [exp.findall(x)[0] for x in data_collection['ids'] if exp.match(x)]
-    logger.info(f"Ids en la base de datos chromaDB {len(ids_chroma)}")
+    # de esos ids, tomamos los que ya estan en ChromaDB
+    ids_chroma = ndetalles_en_chroma(ids_bd.keys())
+    logger.info(f"Ids ya clasificados en chromaDB {len(ids_chroma)}")
 
     # filtramos los ids
-    filtrados = set(ids_bd.keys()) - set(ids_chroma)
+    filtrados = set(ids_bd.keys()) - ids_chroma
     logger.info(f"Numero de ids filtrados {len(filtrados)}")
-    # Inicializacion ...
+
+    # 1. leemos los encabezados de todos los pdfs
     ids = []
     documents = []
-    embeddings = []
-    metadatos = []
-
-    # para cada uno de los ndetalles filtrados
-    for i,ndetalle in enumerate(filtrados):
-        
-        # calculamos la url y luego leemos la primera pagina
-        url = ids_bd[ndetalle]
-        lineas = leer_paginas_pdf_como_lineas(url,1)
-    
-        # tomamos la materia
-        materia = lineas[0][4]
-        materia_limpia = materia.lower().replace('y otros','').replace('y otro','').strip()
-
-        # tomamos la casacion para determinar si existe o no una queja
-        queja = 'queja' in lineas[0][2].lower()
-
-        # tomamos el embedding de la "consulta" de la materia
-        embedding_consulta = np.array(get_embedding(materia_limpia)).tolist()
-
-        # tomamos cuales son los 5 resultados que mas se parecen
-        resultado = collection.query(
-            query_embeddings=[embedding_consulta],
-            n_results=10 #
-        )
+    quejas = []
+    pares = [(ndetalle, ids_bd[ndetalle]) for ndetalle in filtrados]
+    for i, (ndetalle, pdf_bytes, error) in enumerate(descargar_en_paralelo(pares)):
+        if error:
+            logger.error(f"Error leyendo {ndetalle}: {error}")
+            continue
+        try:
+            # leemos la primera pagina
+            lineas = lineas_de_pdf(pdf_bytes, 1)
 
-        # tomamos la moda (el resultado que mas se repite)
-        lista = [x['materia'] for x in resultado['metadatas'][0] if 'queja' not in x['materia']]
-        materia_clasificacion  = lista[0] if len(lista)!=0 else 'queja'
+            # tomamos la materia
+            materia = lineas[0][4]
+            materia_limpia = materia.lower().replace('y otros','').replace('y otro','').strip()
 
+            # tomamos la casacion para determinar si existe o no una queja
+            queja = 'queja' in lineas[0][2].lower()
+        except Exception as e:
+            logger.error(f"Error leyendo encabezado de {ndetalle}: {e}")
+            continue
 
-        # agregamos los resultados
         ids.append('id_'+ndetalle+'_materia')
         documents.append(materia_limpia)
-        embeddings.append(np.array(get_embedding(materia_limpia)))
-        metadatos.append({'parte':'materia','materia':materia_clasificacion if not queja else 'queja'})
-
-        logger.info(f"Agregando clasificacion por materia a {url} -> {i}/{len(filtrados)}")
+        quejas.append(queja)
+        logger.info(f"Leyendo encabezado de {ids_bd[ndetalle]} -> {i}/{len(filtrados)}")
 
     if len(ids)==0:
         logger.info("No hay nada nuevo por hoy!!...")
         return
-    collection.add(
-        ids=ids,
-        documents=documents,
-        embeddings=embeddings,
-        metadatas=metadatos,
-    )
+
+    # 2. un solo encode por lotes; el mismo embedding sirve como consulta y
+    # como embedding guardado
+    with medir("embedding"):
+        embeddings = model.encode(documents, batch_size=tamano_lote_embeddings, convert_to_numpy=True).tolist()
+    contar("embedding", len(documents))
+
+    # 3. consultamos los 10 vecinos mas cercanos de varios embeddings a la vez
+    metadatos = []
+    for inicio in range(0, len(embeddings), tamano_lote_consultas):
+        with medir("chroma_consulta"):
+            resultado = collection.query(
+                query_embeddings=embeddings[inicio:inicio + tamano_lote_consultas],
+                n_results=10
+            )
+        for metadatas_vecinos, queja in zip(resultado['metadatas'], quejas[inicio:inicio + tamano_lote_consultas]):
+            # tomamos el mas cercano que no sea queja
+            lista = [x['materia'] for x in metadatas_vecinos if 'queja' not in x['materia']]
+            materia_clasificacion  = lista[0] if len(lista)!=0 else 'queja'
+            metadatos.append({'parte':'materia','materia':materia_clasificacion if not queja else 'queja'})
+        logger.info(f"Clasificadas por materia {len(metadatos)}/{len(ids)}")
+
+    # 4. guardamos en lotes menores al limite de chroma
+    for inicio in range(0, len(ids), 4000):
+        with medir("chroma_insercion"):
+            collection.add(
+                ids=ids[inicio:inicio + 4000],
+                documents=documents[inicio:inicio + 4000],
+                embeddings=embeddings[inicio:inicio + 4000],
+                metadatas=metadatos[inicio:inicio + 4000],
+            )
+        contar("chroma_insercion", len(ids[inicio:inicio + 4000]))
 
     logger.info("Terminado ...")
     
+def indexar_semantica(tamano_lote=256, tamano_lote_embeddings=64):
+    # embeddings de sumilla + parte resolutiva para /similar y /semantic_search;
+    # solo de las sentencias con texto guardado que aun no estan en la coleccion
+    conn = get_db_connection()
+    cur = conn.cursor()
+    crear_tabla_textos(cur)
+    conn.commit()
+
+    cur.execute("SELECT ndetalle FROM textos_sentencias")
+    ndetalles = [fila[0] for fila in cur.fetchall()]
+    existentes = ndetalles_en_chroma(ndetalles, coleccion=coleccion_semantica, parte='sentencia')
+    faltantes = [ndetalle for ndetalle in ndetalles if ndetalle not in existentes]
+    logger.info(f"Sentencias sin embedding semantico {len(faltantes)}")
+
+    # los textos se leen por lotes para no traer todo el corpus a memoria
+    indexadas = 0
+    for lote in iterar_por_lotes(faltantes, tamano_lote):
+        cur.execute('''
+            SELECT s.ndetalle, s.sumilla, s.organo_detalle, t.texto
+            FROM sentencias_y_autos s
+            JOIN textos_sentencias t ON t.ndetalle = s.ndetalle
+            WHERE s.ndetalle = ANY(%s)
+        ''', (lote,))
+        filas = cur.fetchall()
+        if not filas:
+            continue
+
+        ids = ['id_'+ndetalle+'_sentencia' for ndetalle, _, _, _ in filas]
+        documents = [f"{sumilla or ''}\n{parte_resolutiva(texto)}".strip() for _, sumilla, _, texto in filas]
+        metadatos = [{'parte':'sentencia','organo_detalle':organo or ''} for _, _, organo, _ in filas]
+        with medir("embedding"):
+            embeddings = model.encode(documents, batch_size=tamano_lote_embeddings, convert_to_numpy=True).tolist()
+        contar("embedding", len(documents))
+        with medir("chroma_insercion"):
+            coleccion_semantica.add(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatos)
+        contar("chroma_insercion", len(ids))
+
+        indexadas += len(filas)
+        logger.info(f"Embeddings semanticos {indexadas}/{len(faltantes)}")
+
+    cur.close()
+    conn.close()
+
 # -------------------------------------------------------------------------------------
 
 
+# --------------------------------- Estadisticas por juez -------------------------------
+# ----------------------------------------------------------------------------------------
+
+# Resumen que usa /statistics del backend: totales y urls nulas por juez, organo
+# y fecha_resolucion. Se agrupa por el valor exacto de fecha_resolucion para que
+# cualquier rango de fechas de exactamente lo mismo que la consulta original.
+CONSULTA_ESTADISTICAS = """
+    SELECT
+        j.codigo,
+        j.nombre_juez,
+        s.organo_detalle,
+        s.fecha_resolucion,
+        COUNT(*) AS total,
+        COUNT(*) - COUNT(s.url) AS nulos
+    FROM sentencias_y_autos s
+    LEFT JOIN sentencias_jueces sj ON sj.ndetalle = s.ndetalle
+    LEFT JOIN jueces j ON j.codigo = sj.codigo
+    {where_sql}
+    GROUP BY j.codigo, j.nombre_juez, s.organo_detalle, s.fecha_resolucion
+"""
+
+def crear_tabla_pendientes(cur):
+    # sentencias cargadas o enrutadas que aun no estan reflejadas en
+    # estadisticas_jueces. Se marcan en la misma transaccion que el lote que
+    # las cambia y se borran al recalcular: si la carga se corta antes del paso
+    # 5, la siguiente ejecucion las recalcula igual.
+    cur.execute("CREATE TABLE IF NOT EXISTS estadisticas_pendientes (ndetalle TEXT PRIMARY KEY);")
+
+def marcar_pendientes(cur, ndetalles):
+    execute_values(cur, """
+        INSERT INTO estadisticas_pendientes (ndetalle)
+        VALUES %s
+        ON CONFLICT DO NOTHING;
+    """, [(str(ndetalle),) for ndetalle in ndetalles], page_size=len(ndetalles) or 1)
+
+def actualizar_estadisticas(completo=False):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    crear_tabla_pendientes(cur)
+
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS estadisticas_jueces AS
+        {CONSULTA_ESTADISTICAS.format(where_sql="")}
+        WITH NO DATA;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS estadisticas_jueces_fecha_idx ON estadisticas_jueces (fecha_resolucion);")
+
+    cur.execute("SELECT EXISTS (SELECT 1 FROM estadisticas_jueces);")
+    if completo or not cur.fetchone()[0]:
+        # primera vez (o ESTADISTICAS-COMPLETAS=1): se calcula todo
+        logger.info("Calculando estadisticas completas")
+        cur.execute("TRUNCATE estadisticas_jueces, estadisticas_pendientes;")
+        cur.execute(f"INSERT INTO estadisticas_jueces {CONSULTA_ESTADISTICAS.format(where_sql='')};")
+    else:
+        # solo se recalculan las fechas de las sentencias pendientes, que se
+        # consumen en esta misma transaccion
+        cur.execute("CREATE TEMP TABLE fechas_afectadas (fecha_resolucion DATE) ON COMMIT DROP;")
+        cur.execute("""
+            WITH procesadas AS (
+                DELETE FROM estadisticas_pendientes RETURNING ndetalle
+            )
+            INSERT INTO fechas_afectadas
+            SELECT DISTINCT s.fecha_resolucion
+            FROM sentencias_y_autos s
+            JOIN procesadas p ON p.ndetalle = s.ndetalle;
+        """)
+        cur.execute("""
+            DELETE FROM estadisticas_jueces e
+            USING fechas_afectadas f
+            WHERE e.fecha_resolucion IS NOT DISTINCT FROM f.fecha_resolucion;
+        """)
+        where_sql = """
+            WHERE EXISTS (
+                SELECT 1 FROM fechas_afectadas f
+                WHERE s.fecha_resolucion IS NOT DISTINCT FROM f.fecha_resolucion
+            )
+        """
+        cur.execute(f"INSERT INTO estadisticas_jueces {CONSULTA_ESTADISTICAS.format(where_sql=where_sql)};")
+        logger.info(f"Estadisticas recalculadas para {cur.rowcount} grupos")
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+# -------------------------------------------------------------------------------------
+
+
+def notificar_fin_de_carga():
+    # invalida la cache de /filters del backend, si esta configurado (sin
+    # TOKEN-INVALIDACION el backend no expone el endpoint)
+    url_api = os.getenv("URL-API")
+    token = os.getenv("TOKEN-INVALIDACION")
+    if not url_api or not token:
+        return
+    try:
+        headers = {"X-Token": token}
+        resp = requests.post(f"{url_api}/filters/invalidar", headers=headers, timeout=10)
+        resp.raise_for_status()
+        logger.info("Cache de filtros del backend invalidada")
+    except requests.RequestException as e:
+        logger.error(f"No se pudo invalidar la cache de filtros: {e}")
+
+
 def main():
     logger.info("------------------ Empezando guardado de datos ---------------")
-    # 1. cargar jsons a base de datos
-    logger.info("1.1. Empezando filtrado para cargar json en base de datos ")
-    json_filtrados = filtrar_precargado_json()
-    logger.info("1.2. Empezando carga de json a base de datos")
-    cargar_json_a_database(json_filtrados)
-
-    # 2. cargar ruta del bucket al campo "url" de la base de datos.
-    logger.info("2. Empezando enrutado de pdfs en base de datos.")
-    enrutar_pdfs()
-
-    # 3. Clasificar por fundado e infundado los archivos pdfs
-    logger.info("3. Empezando clasificacion de los pdfs")
-    clasificar_archivos()
-
-    # 4. Clasificar por materias los archivos pdfs
-    logger.info("4. Empezando clasificacion de los pdfs")
-    clasificar_por_materias()
+    try:
+        # 1. cargar jsons a base de datos
+        # cada lote se carga antes de filtrar el siguiente, asi los repetidos
+        # entre lotes tambien quedan filtrados
+        logger.info("1. Empezando filtrado y carga de json a base de datos")
+        with medir("paso_1_carga_json"):
+            for json_filtrados in iterar_json_filtrado():
+                cargar_json_a_database_por_lotes(json_filtrados)
+
+        # 2. cargar ruta del bucket al campo "url" de la base de datos.
+        logger.info("2. Empezando enrutado de pdfs en base de datos.")
+        with medir("paso_2_enrutado"):
+            enrutar_pdfs()
+
+        # 3. Clasificar por fundado e infundado los archivos pdfs
+        logger.info("3. Empezando clasificacion de los pdfs")
+        with medir("paso_3_clasificacion"):
+            clasificar_archivos()
+
+        # 3.1. Guardar el texto de los pdfs que aun no lo tienen (busqueda por texto)
+        if os.getenv("INDEXAR-TEXTOS", "1") == "1":
+            logger.info("3.1. Indexando texto de los pdfs")
+            try:
+                with medir("paso_3_1_textos"):
+                    indexar_textos_faltantes()
+            except Exception as e:
+                # el texto solo sirve a la busqueda por palabras: si falla, la
+                # carga sigue con materias y estadisticas
+                logger.error(f"Error indexando textos: {e}")
+
+        # 4. Clasificar por materias los archivos pdfs
+        logger.info("4. Empezando clasificacion de los pdfs")
+        with medir("paso_4_materias"):
+            clasificar_por_materias()
+
+        # 4.1. Embeddings de sumilla y parte resolutiva (busqueda semantica)
+        if os.getenv("INDEXAR-SEMANTICA", "1") == "1":
+            logger.info("4.1. Indexando embeddings semanticos")
+            try:
+                with medir("paso_4_1_semantica"):
+                    indexar_semantica()
+            except Exception as e:
+                # como el texto, es auxiliar: la carga sigue con las estadisticas
+                logger.error(f"Error indexando embeddings semanticos: {e}")
+
+        logger.info(cache_pdf.resumen())
+
+        # 5. actualizar el resumen de estadisticas con las sentencias
+        # pendientes (cargadas o enrutadas en esta ejecucion o en una anterior
+        # que no llego a este paso); ESTADISTICAS-COMPLETAS=1 lo recalcula todo
+        logger.info("5. Actualizando estadisticas por juez")
+        with medir("paso_5_estadisticas"):
+            actualizar_estadisticas(completo=os.getenv("ESTADISTICAS-COMPLETAS", "0") == "1")
+
+        # 6. avisar al backend que hay datos nuevos
+        notificar_fin_de_carga()
+    finally:
+        # resumen de tiempos por etapa, tambien si la carga fallo a medias
+        logger.info(resumen_metricas())
+        exportar_metricas()
 
 
 if __name__=='__main__':
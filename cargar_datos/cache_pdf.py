@@ -0,0 +1,115 @@
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# Cache local en disco de los blobs del bucket, con desalojo LRU. Cada archivo
+# se guarda con el nombre del blob y su generation, asi una nueva version del
+# blob en el bucket nunca devuelve el contenido viejo.
+class CachePDF:
+
+    def __init__(self, directorio, tamano_maximo_bytes):
+        self.directorio = directorio
+        self.tamano_maximo_bytes = tamano_maximo_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        self._archivos = OrderedDict()  # ruta -> tamano, del menos al mas reciente
+        self._tamano_total = 0
+
+        os.makedirs(directorio, exist_ok=True)
+        existentes = []
+        for nombre in os.listdir(directorio):
+            ruta = os.path.join(directorio, nombre)
+            if nombre.endswith(".pdf") and os.path.isfile(ruta):
+                estado = os.stat(ruta)
+                existentes.append((estado.st_mtime, ruta, estado.st_size))
+        for _, ruta, tamano in sorted(existentes):
+            self._archivos[ruta] = tamano
+            self._tamano_total += tamano
+        self._desalojar()
+
+    def _ruta(self, nombre_blob, generation):
+        clave = hashlib.sha1(nombre_blob.encode("utf-8")).hexdigest()
+        return os.path.join(self.directorio, f"{clave}_{generation}.pdf")
+
+    def _desalojar(self):
+        while self._tamano_total > self.tamano_maximo_bytes and self._archivos:
+            ruta, tamano = self._archivos.popitem(last=False)
+            self._tamano_total -= tamano
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+    def leer(self, bucket, nombre_blob, timeout=15):
+        # solo se piden los metadatos para conocer la generation actual
+        blob = bucket.get_blob(nombre_blob, timeout=timeout)
+        if blob is None:
+            raise FileNotFoundError(f"No existe el blob {nombre_blob}")
+        ruta = self._ruta(nombre_blob, blob.generation or blob.etag)
+
+        # el lock solo protege _archivos; el archivo se lee fuera de el para que
+        # los hilos de descarga no se esperen entre si por el disco. Se marca
+        # como reciente antes de leerlo para que otro hilo no lo desaloje.
+        with self._lock:
+            en_cache = ruta in self._archivos
+            if en_cache:
+                self._archivos.move_to_end(ruta)
+
+        if en_cache:
+            try:
+                with open(ruta, "rb") as f:
+                    contenido = f.read()
+            except FileNotFoundError:
+                # desalojado o borrado entre la revision y la lectura
+                with self._lock:
+                    if ruta in self._archivos:
+                        self._tamano_total -= self._archivos.pop(ruta)
+            else:
+                try:
+                    os.utime(ruta)
+                except FileNotFoundError:
+                    pass
+                with self._lock:
+                    self.aciertos += 1
+                return contenido
+
+        contenido = blob.download_as_bytes(timeout=timeout)
+        self.guardar(ruta, contenido)
+        with self._lock:
+            self.fallos += 1
+        return contenido
+
+    def guardar(self, ruta, contenido):
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(contenido)
+        os.replace(temporal, ruta)
+
+        with self._lock:
+            if ruta in self._archivos:
+                self._tamano_total -= self._archivos.pop(ruta)
+            self._archivos[ruta] = len(contenido)
+            self._tamano_total += len(contenido)
+            self._desalojar()
+
+    def resumen(self):
+        total = self.aciertos + self.fallos
+        porcentaje = 100 * self.aciertos / total if total else 0
+        return (
+            f"Cache PDF: {self.aciertos} aciertos, {self.fallos} fallos ({porcentaje:.1f}% aciertos), "
+            f"{len(self._archivos)} archivos, {self._tamano_total / 1024 ** 2:.1f} MB"
+        )
+
+
+def crear_cache_pdf():
+    # directorio y tamano maximo configurables por variables de entorno
+    return CachePDF(
+        directorio=os.getenv("CACHE-PDF-DIR", "cache_pdf"),
+        tamano_maximo_bytes=int(os.getenv("CACHE-PDF-MAX-MB", "2048")) * 1024 ** 2,
+    )
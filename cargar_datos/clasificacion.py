@@ -4,6 +4,7 @@ import re
 import pdfplumber
 import io
 import logging
+import time
 
 logging.getLogger("pdfminer").setLevel(logging.ERROR)
 
@@ -40,6 +41,20 @@ def combinar_listas_regex(primeras_bases, segundas_palabras):
             patrones.append(patron)
     return patrones
 
+# Los patrones se construyen una sola vez al importar el modulo, en el orden de
+# combinar_listas_regex (el de las claves que devuelve estructura_pdf).
+PATRONES_REGEX = list(dict.fromkeys(combinar_listas_regex(PRIMERAS_PALABRAS, SEGUNDAS_PALABRAS)))
+
+# Escaner unico equivalente a la union de PATRONES_REGEX: recorre el texto una
+# sola vez y los grupos permiten reconstruir el patron que coincidio.
+_FORMAS_PRIMERAS = sorted({forma.strip() for forma in generar_formas(PRIMERAS_PALABRAS)}, key=len, reverse=True)
+_FORMAS_SEGUNDAS = sorted({palabra.strip() for palabra in SEGUNDAS_PALABRAS}, key=len, reverse=True)
+ESCANER_DECISION = re.compile(
+    r"(?P<primera>" + "|".join(re.escape(forma) for forma in _FORMAS_PRIMERAS) + r")"
+    r"\s+"
+    r"(?P<segunda>" + "|".join(re.escape(palabra) for palabra in _FORMAS_SEGUNDAS) + r")"
+)
+
 class Manejador(ABC):
     def __init__(self, siguiente=None):
         self._siguiente = siguiente
@@ -92,16 +107,19 @@ class Manejador3(Manejador):
         return 'desconocido'
 
 def estructura_pdf(contenido):
-    claves = {}
-    patrones_regex = combinar_listas_regex(PRIMERAS_PALABRAS, SEGUNDAS_PALABRAS)
     tamano_texto = len(contenido)
 
-    for patron in patrones_regex:
-        coincidencias = re.findall(patron, contenido)
-        if coincidencias:
-            coincidencias_unicas = list(set(coincidencias))
-            for coincidencia in coincidencias_unicas:
-                claves[patron] = contenido.rfind(coincidencia)/tamano_texto
+    # ultima posicion de cada patron en una sola pasada sobre el texto
+    ultimas_posiciones = {}
+    for coincidencia in ESCANER_DECISION.finditer(contenido):
+        p1 = re.escape(coincidencia.group('primera'))
+        p2 = re.escape(coincidencia.group('segunda'))
+        ultimas_posiciones[rf"{p1}\s+{p2}"] = coincidencia.start()
+
+    claves = {}
+    for patron in PATRONES_REGEX:
+        if patron in ultimas_posiciones:
+            claves[patron] = ultimas_posiciones[patron]/tamano_texto
 
     return claves
 
@@ -111,9 +129,21 @@ def formateo_estructura(claves):
         for palabra_clave, valor in claves.items():
             if key not in palabra_clave:
                 continue
-            claves_diccionario[value] = valor
+            # nos quedamos con la ultima aparicion de cada clase, sin depender
+            # del orden en que se generaron los patrones
+            claves_diccionario[value] = max(valor, claves_diccionario.get(value, valor))
     return claves_diccionario
 
+def parte_resolutiva(contenido, max_caracteres=1500):
+    # desde la ultima formula de decision ("DECLARARON FUNDADO", ...) hasta
+    # max_caracteres despues; si no aparece ninguna, el final del documento
+    inicio = None
+    for coincidencia in ESCANER_DECISION.finditer(contenido):
+        inicio = coincidencia.start()
+    if inicio is None:
+        return contenido[-max_caracteres:]
+    return contenido[inicio:inicio + max_caracteres]
+
 
 def clasificar_archivo_pdf(contenido, id_val):
     handler_chain = Manejador1(Manejador2(Manejador3()))
@@ -134,4 +164,84 @@ def extraer_texto_pdf(pdf_bytes):
     with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
         for pagina in pdf.pages:
             texto += pagina.extract_text() or ""
-    return texto
\ No newline at end of file
+    return texto
+
+def decision_segura(cola, paginas_extraidas, paginas_totales, margen=0.05):
+    # Clasifica usando solo las ultimas paginas. Las posiciones se llevan al
+    # largo estimado del documento completo (promedio de caracteres por pagina)
+    # y solo se decide si el resultado no puede cambiar por lo que haya en las
+    # paginas aun no extraidas: cualquier clave que aparezca solo ahi quedaria
+    # antes de fraccion_previa. El margen cubre el error de la estimacion.
+    if not cola:
+        return None
+    largo_estimado = len(cola) * paginas_totales / paginas_extraidas
+    inicio_cola = largo_estimado - len(cola)
+    fraccion_previa = inicio_cola / largo_estimado
+
+    claves_diccionario = formateo_estructura(estructura_pdf(cola))
+    if not claves_diccionario:
+        return None
+    posiciones = sorted(
+        ((inicio_cola + valor * len(cola)) / largo_estimado, clase)
+        for clase, valor in claves_diccionario.items()
+    )
+    posicion, clase = posiciones[-1]
+    segunda = posiciones[-2][0] if len(posiciones) > 1 else 0
+
+    if len(posiciones) == 1 and posicion <= 0.6 + margen:  # Manejador1
+        return None
+    if posicion - max(segunda, fraccion_previa) <= 0.20 + margen:  # Manejador2
+        return None
+    return clase
+
+def clasificar_pdf_desde_el_final(pdf_bytes, id_val):
+    # extrae paginas de la ultima hacia la primera y se detiene cuando
+    # decision_segura es concluyente; si no, termina con el documento completo
+    textos = []
+    extraccion = 0.0
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        paginas_totales = len(pdf.pages)
+        for pagina in reversed(pdf.pages):
+            inicio = time.perf_counter()
+            textos.append(pagina.extract_text() or "")
+            extraccion += time.perf_counter() - inicio
+            if len(textos) == paginas_totales:
+                break
+            clase = decision_segura("".join(reversed(textos)), len(textos), paginas_totales)
+            if clase:
+                return {
+                    'ndetalle': id_val,
+                    'clase': clase,
+                    'paginas_extraidas': len(textos),
+                    'paginas_totales': paginas_totales,
+                    'segundos_extraccion': extraccion
+                }
+
+    resultado = clasificar_archivo_pdf("".join(reversed(textos)), id_val)
+    resultado['paginas_extraidas'] = len(textos)
+    resultado['paginas_totales'] = paginas_totales
+    resultado['segundos_extraccion'] = extraccion
+    return resultado
+
+def clasificar_pdf_bytes(pdf_bytes, id_val, desde_el_final=False, texto_completo=False):
+    # punto de entrada de los procesos de clasificar_archivos: debe ser
+    # una funcion de modulo para poder enviarse al pool. Los tiempos vuelven
+    # en el resultado porque las metricas se registran en el proceso principal.
+    # Con texto_completo (se indexa el texto) hay que extraer todas las paginas
+    # de todos modos: se clasifica con el texto completo, sin la estimacion
+    # desde el final, y el texto vuelve en el resultado. Sin el, no se devuelve.
+    inicio = time.perf_counter()
+    if desde_el_final and not texto_completo:
+        resultado = clasificar_pdf_desde_el_final(pdf_bytes, id_val)
+        extraccion = resultado.pop('segundos_extraccion')
+    else:
+        texto = extraer_texto_pdf(pdf_bytes)
+        extraccion = time.perf_counter() - inicio
+        resultado = clasificar_archivo_pdf(texto, id_val)
+        if texto_completo:
+            resultado['texto'] = texto
+    resultado['tiempos'] = {
+        'extraccion_pdf': extraccion,
+        'clasificacion': time.perf_counter() - inicio - extraccion
+    }
+    return resultado
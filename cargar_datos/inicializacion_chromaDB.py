@@ -7,6 +7,7 @@ import pdfplumber
 import io
 import json
 import logging
+from cache_pdf import crear_cache_pdf
 
 def configurar_logger():
     logger = logging.getLogger()
@@ -29,6 +30,7 @@ storage_client = storage.Client(credentials=credentials)
 bucket = storage_client.bucket("automatizacion-casillero")
 
 load_dotenv(verbose=False)
+cache_pdf = crear_cache_pdf()
 
 conn = psycopg2.connect(
         host=os.getenv("DB-HOST"),
@@ -56,10 +58,7 @@ total = cur.fetchall()
 logger.info(f"Total = {len(total)}")
 
 def leer_paginas_pdf_como_lineas(pdf_key , num_paginas=1):
-    blob = bucket.blob(pdf_key)
-    buffer = io.BytesIO()
-    blob.download_to_file(buffer)
-    buffer.seek(0)
+    buffer = io.BytesIO(cache_pdf.leer(bucket, pdf_key))
 
     resultado = []
     with pdfplumber.open(buffer) as pdf:
@@ -87,4 +86,6 @@ for ndetalle,url in total:
     contador += 1
 
 with open("encabezado.json", "w", encoding="utf-8") as f:
-    json.dump(total_save, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+    json.dump(total_save, f, ensure_ascii=False, indent=2)
+
+logger.info(cache_pdf.resumen())
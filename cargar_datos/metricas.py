@@ -0,0 +1,129 @@
+from contextlib import contextmanager
+import logging
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, push_to_gateway, write_to_textfile
+
+logger = logging.getLogger(__name__)
+
+# Metricas de la carga por etapa: duracion de cada operacion (histograma),
+# elementos procesados y errores. Van en un registro propio para exportar solo
+# esto al terminar, como archivo de texto de Prometheus o a un Pushgateway.
+registro = CollectorRegistry()
+
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+DURACION_ETAPA = Histogram(
+    "carga_etapa_segundos", "Duracion de cada operacion de la carga",
+    ["etapa"], buckets=BUCKETS_SEGUNDOS, registry=registro
+)
+ELEMENTOS_ETAPA = Counter(
+    "carga_elementos_total", "Elementos procesados por etapa",
+    ["etapa"], registry=registro
+)
+ERRORES_ETAPA = Counter(
+    "carga_errores_total", "Operaciones fallidas por etapa",
+    ["etapa"], registry=registro
+)
+
+
+@contextmanager
+def medir(etapa):
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORES_ETAPA.labels(etapa).inc()
+        raise
+    finally:
+        DURACION_ETAPA.labels(etapa).observe(time.perf_counter() - inicio)
+
+
+def observar(etapa, segundos):
+    # para tiempos medidos en otro proceso (workers de clasificacion)
+    DURACION_ETAPA.labels(etapa).observe(segundos)
+
+
+def contar(etapa, elementos=1):
+    ELEMENTOS_ETAPA.labels(etapa).inc(elementos)
+
+
+def _cuantil(buckets, total, q):
+    # interpolacion lineal dentro del bucket, igual que histogram_quantile
+    objetivo = q * total
+    limite_anterior, acumulado_anterior = 0.0, 0.0
+    for limite, acumulado in buckets:
+        if acumulado >= objetivo:
+            if limite == float("inf"):
+                return limite_anterior
+            fraccion = (objetivo - acumulado_anterior) / max(acumulado - acumulado_anterior, 1e-12)
+            return limite_anterior + (limite - limite_anterior) * fraccion
+        limite_anterior, acumulado_anterior = limite, acumulado
+    return limite_anterior
+
+
+def etapas_metricas():
+    # por etapa: operaciones, segundos, media/p50/p99 en segundos, elementos y errores
+    etapas = {}
+    for metrica in registro.collect():
+        for muestra in metrica.samples:
+            etapa = etapas.setdefault(muestra.labels.get("etapa"), {"buckets": []})
+            if muestra.name == "carga_etapa_segundos_bucket":
+                etapa["buckets"].append((float(muestra.labels["le"]), muestra.value))
+            elif muestra.name == "carga_etapa_segundos_count":
+                etapa["operaciones"] = muestra.value
+            elif muestra.name == "carga_etapa_segundos_sum":
+                etapa["segundos"] = muestra.value
+            elif muestra.name == "carga_elementos_total":
+                etapa["elementos"] = muestra.value
+            elif muestra.name == "carga_errores_total":
+                etapa["errores"] = muestra.value
+
+    resultado = {}
+    for nombre, etapa in etapas.items():
+        operaciones = etapa.get("operaciones", 0)
+        buckets = sorted(etapa.pop("buckets"))
+        etapa.setdefault("segundos", 0.0)
+        etapa.setdefault("elementos", 0.0)
+        etapa.setdefault("errores", 0.0)
+        etapa["operaciones"] = operaciones
+        if operaciones:
+            etapa["media"] = etapa["segundos"] / operaciones
+            etapa["p50"] = _cuantil(buckets, operaciones, 0.5)
+            etapa["p99"] = _cuantil(buckets, operaciones, 0.99)
+        resultado[nombre] = etapa
+    return resultado
+
+
+def resumen_metricas():
+    lineas = ["Resumen de metricas por etapa:"]
+    for nombre, etapa in sorted(etapas_metricas().items(), key=lambda x: -x[1]["segundos"]):
+        linea = f"  {nombre}: {etapa['operaciones']:.0f} ops"
+        if etapa["operaciones"]:
+            linea += (
+                f", {etapa['segundos']:.1f}s total"
+                f", media {1000 * etapa['media']:.1f}ms"
+                f", p50 {1000 * etapa['p50']:.1f}ms"
+                f", p99 {1000 * etapa['p99']:.1f}ms"
+            )
+        if etapa["elementos"]:
+            linea += f", {etapa['elementos']:.0f} elementos"
+        if etapa["errores"]:
+            linea += f", {etapa['errores']:.0f} errores"
+        lineas.append(linea)
+    return "\n".join(lineas)
+
+
+def exportar_metricas():
+    # METRICAS-ARCHIVO para el textfile collector de node_exporter,
+    # METRICAS-PUSHGATEWAY para enviarlas a un Pushgateway
+    archivo = os.getenv("METRICAS-ARCHIVO")
+    if archivo:
+        write_to_textfile(archivo, registro)
+    pushgateway = os.getenv("METRICAS-PUSHGATEWAY")
+    if pushgateway:
+        try:
+            push_to_gateway(pushgateway, job="cargar_datos", registry=registro)
+        except Exception as e:
+            logger.error(f"No se pudieron enviar las metricas a {pushgateway}: {e}")
@@ -1,6 +1,8 @@
 # app_front.py
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
 import pandas as pd
@@ -8,6 +10,14 @@ import pandas as pd
 load_dotenv()
 API_BASE_URL = os.getenv("URL_API")
 
+# Segundos que se reutiliza cada respuesta del backend entre reruns. Las URLs
+# firmadas llegan con al menos 15 minutos de vida, por eso su TTL es menor.
+TTL_FILTROS = int(os.getenv("CACHE_TTL_FILTROS", "300"))
+TTL_BUSQUEDA = int(os.getenv("CACHE_TTL_BUSQUEDA", "60"))
+TTL_ESTADISTICAS = int(os.getenv("CACHE_TTL_ESTADISTICAS", "300"))
+TTL_URLS = int(os.getenv("CACHE_TTL_URLS", "600"))
+HILOS_DESCARGA = 8
+
 # Lista fija de jueces para estadísticas
 JUECES_LIST = [
     "ARÉVALO VELA, JAVIER",
@@ -25,16 +35,59 @@ JUECES_LIST = [
 
 st.set_page_config(layout="wide")
 
+# -----------------------
+# Sesión HTTP y caché
+# -----------------------
+@st.cache_resource
+def obtener_sesion():
+    """Sesión HTTP compartida entre reruns, con keep-alive y pool de conexiones."""
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=HILOS_DESCARGA * 2)
+    sesion.mount("http://", adaptador)
+    sesion.mount("https://", adaptador)
+    return sesion
+
+def normalizar_params(params):
+    """Convierte los parámetros en una tupla ordenada, usable como clave de caché."""
+    return tuple(sorted(
+        (clave, tuple(valor) if isinstance(valor, list) else valor)
+        for clave, valor in (params or {}).items()
+    ))
+
+def _get_json(endpoint, params_normalizados):
+    """GET al backend; los errores se propagan para que no queden en caché."""
+    resp = obtener_sesion().get(f"{API_BASE_URL}{endpoint}", params=dict(params_normalizados))
+    resp.raise_for_status()
+    return resp.json()
+
+@st.cache_data(ttl=TTL_FILTROS, show_spinner=False)
+def _filtros_en_cache():
+    return _get_json("/filters", ())
+
+@st.cache_data(ttl=TTL_BUSQUEDA, show_spinner=False)
+def _busqueda_en_cache(params_normalizados):
+    return _get_json("/search", params_normalizados)
+
+@st.cache_data(ttl=TTL_ESTADISTICAS, show_spinner=False)
+def _estadisticas_en_cache(params_normalizados):
+    return _get_json("/statistics", params_normalizados)
+
+@st.cache_data(ttl=TTL_URLS, show_spinner=False)
+def _urls_en_cache(ndetalles):
+    return _get_json("/descargar", (("ndetalles", ndetalles),)).get("urls", {})
+
+CONSULTAS_EN_CACHE = {
+    "/search": _busqueda_en_cache,
+    "/statistics": _estadisticas_en_cache,
+}
+
 # -----------------------
 # Carga de filtros
 # -----------------------
-#@st.cache_data
 def cargar_filtros():
     """Obtiene los valores disponibles para filtros desde el backend."""
     try:
-        resp = requests.get(f"{API_BASE_URL}/filters")
-        resp.raise_for_status()
-        return resp.json()
+        return _filtros_en_cache()
     except requests.RequestException as e:
         st.error(f"Error al cargar filtros: {e}")
         return {"organo_detalle": [], "nombre_juez": []}
@@ -76,21 +129,20 @@ def display_search_page():
         sel_juez = st.selectbox("Nombre Juez", opts_juez)
 
     solo_sentencias = st.checkbox("Solo sentencias")
-    col5, _ = st.columns(2)
+    col5, col6 = st.columns(2)
     with col5:
         sel_materia = st.selectbox("Materia", opts_materia)
+    with col6:
+        palabras_clave = st.text_input("Palabras clave en el texto")
 
     if st.button("Buscar"):
         st.session_state.pagina_actual = 1
+        st.session_state.cursores = {}
 
     page = st.session_state.get("pagina_actual", 1)
     limit = 100
-    offset = (page - 1) * limit
 
-    params = build_params(
-        fecha_desde, fecha_hasta, sel_organo, solo_sentencias,
-        extra={"limit": limit, "offset": offset}
-    )
+    params = build_params(fecha_desde, fecha_hasta, sel_organo, solo_sentencias)
     # añadir filtro de juez en búsqueda
     if sel_juez and sel_juez != "Todos":
         params["nombre_juez"] = sel_juez
@@ -98,6 +150,23 @@ def display_search_page():
     if sel_materia and sel_materia != "Todas":
         params["materia"] = sel_materia
 
+    if palabras_clave.strip():
+        params["q"] = palabras_clave.strip()
+
+    # los cursores guardados solo valen para los mismos filtros
+    clave_busqueda = tuple(sorted(params.items()))
+    if st.session_state.get("clave_busqueda") != clave_busqueda:
+        st.session_state.clave_busqueda = clave_busqueda
+        st.session_state.cursores = {}
+
+    # cursor de la pagina si ya lo conocemos; si no, se pagina por offset
+    # (la busqueda por texto se ordena por relevancia y no usa cursor)
+    cursor = st.session_state.cursores.get(page) if "q" not in params else None
+    if cursor:
+        params.update({"limit": limit, "cursor": cursor})
+    else:
+        params.update({"limit": limit, "offset": (page - 1) * limit})
+
     resultado = fetch_data("/search", params)
     show_search_results(resultado, page, limit)
 
@@ -112,14 +181,24 @@ def show_search_results(resultado, page, limit):
         st.warning("Sin resultados.")
         return
 
-    tabla = ["| PDF | Clasificación | Descargar |", "| --- | ------------- | -------- |"]
+    urls = fetch_download_urls([item.get("ndetalle") for item in items])
+
+    con_fragmentos = any("fragmento" in item for item in items)
+    if con_fragmentos:
+        tabla = ["| PDF | Clasificación | Fragmento | Descargar |", "| --- | ------------- | --------- | -------- |"]
+    else:
+        tabla = ["| PDF | Clasificación | Descargar |", "| --- | ------------- | -------- |"]
     for item in items:
         nd = item.get("ndetalle")
         ruta = item.get("url") or ""
         clasif = item.get("clasificacion", "N/A")
-        link = build_download_link(nd)
+        link = f"[📄 Descargar]({urls[nd]})" if urls.get(nd) else "Error URL"
         nombre = ruta.split("/")[-1].split(",")[0] + ".pdf" if ruta else "-"
-        tabla.append(f"| {nombre} | {clasif} | {link} |")
+        if con_fragmentos:
+            fragmento = (item.get("fragmento") or "").replace("\n", " ").replace("|", "\\|")
+            tabla.append(f"| {nombre} | {clasif} | {fragmento} | {link} |")
+        else:
+            tabla.append(f"| {nombre} | {clasif} | {link} |")
 
     st.markdown("\n".join(tabla), unsafe_allow_html=True)
     pages = (total - 1) // limit + 1
@@ -133,6 +212,8 @@ def show_search_results(resultado, page, limit):
     with col_next:
         if st.button("Página siguiente ➡") and page < pages:
             st.session_state.pagina_actual += 1
+            if resultado.get("next_cursor"):
+                st.session_state.cursores[page + 1] = resultado["next_cursor"]
             st.rerun()
 # -----------------------
 # Estadísticas
@@ -179,23 +260,34 @@ def render_stats(stats):
 # Helpers
 # -----------------------
 def fetch_data(endpoint, params):
-    """Petición GET al backend y retorno de JSON."""
+    """Petición GET al backend (con caché TTL si el endpoint la tiene) y retorno de JSON."""
+    params_normalizados = normalizar_params(params)
     try:
-        resp = requests.get(f"{API_BASE_URL}{endpoint}", params=params)
-        resp.raise_for_status()
-        return resp.json()
+        consulta = CONSULTAS_EN_CACHE.get(endpoint)
+        if consulta:
+            return consulta(params_normalizados)
+        return _get_json(endpoint, params_normalizados)
     except requests.RequestException as e:
         st.error(f"Error al obtener datos: {e}")
         return []
     
-def build_download_link(ndetalle):
-    """Genera enlace firmado para descargar PDF."""
+def fetch_download_urls(ndetalles):
+    """Obtiene en una sola petición los enlaces firmados de una página."""
+    if not ndetalles:
+        return {}
+    try:
+        return _urls_en_cache(tuple(ndetalles))
+    except requests.RequestException:
+        # respaldo: un pedido por fila, en paralelo sobre la sesión compartida
+        with ThreadPoolExecutor(max_workers=HILOS_DESCARGA) as ejecutor:
+            return dict(zip(ndetalles, ejecutor.map(fetch_download_url, ndetalles)))
+
+def fetch_download_url(ndetalle):
+    """Obtiene el enlace firmado de un solo PDF (None si falla)."""
     try:
-        resp = requests.get(f"{API_BASE_URL}/descargar/{ndetalle}")
-        resp.raise_for_status()
-        return f"[📄 Descargar]({resp.json().get('url')})"
-    except:
-        return "Error URL"
+        return _get_json(f"/descargar/{ndetalle}", ()).get("url")
+    except requests.RequestException:
+        return None
 
 # -----------------------
 # Main
@@ -205,6 +297,8 @@ def main():
         st.session_state.page = "search"
     if "pagina_actual" not in st.session_state:
         st.session_state.pagina_actual = 1
+    if "cursores" not in st.session_state:
+        st.session_state.cursores = {}
 
     col_nav1, col_nav2 = st.columns([1, 1])
     with col_nav1: